@@ -1,10 +1,25 @@
-from fastapi import FastAPI, Request, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request, Response, HTTPException, Depends, Header, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, Json
+from psycopg2.pool import ThreadedConnectionPool
 from datetime import datetime, date
+import asyncio
+import base64
+import csv
+import hashlib
+import io
+import json
+import math
 import os
+import re
+import select
+import threading
+import time
+import weakref
 
 
 from pydantic import BaseModel, Field, validator
@@ -12,14 +27,18 @@ from typing import Optional, List, Dict, Any, Union
 import uvicorn
 from typing import Dict
 
-# Define emission factors
-EMISSION_FACTORS = {
-    'car': 223.6,
-    'bus': 515.2,
-    'ev': 0,
-    'bike': 26.6,
-    'walk': 0
-}
+from cache import create_response_cache
+from events import Broadcaster, format_sse
+import geohash
+from metrics import Registry, RequestStats, current_request_stats
+from poi_index import CATEGORY_GROUPS, POIIndex, load_pois, normalize_place_name
+from road_graph import RouteCalculator, load_road_graph
+from query_service import create_query_service
+from emissions import (
+    EMISSION_FACTORS, REFERENCE_MODE, THRESHOLD_EMISSIONS,
+    calculate_emissions, calculate_trip_emissions
+)
+
 
 
 
@@ -37,6 +56,10 @@ class TripCreate(BaseModel):
     actual_emissions: Optional[float] = None
     saved_emissions: Optional[float] = None
     ecoscore: Optional[float] = None
+    # Where the trip starts; with latitude/longitude the server works out
+    # the distance when it is not given
+    originLatitude: Optional[float] = Field(None, ge=-90, le=90)
+    originLongitude: Optional[float] = Field(None, ge=-180, le=180)
     
     class Config:
         from_attributes = True
@@ -54,33 +77,452 @@ app.add_middleware(
     allow_origins=["http://localhost:3000", "http://127.0.0.1:5500"],
     allow_credentials=True,
     allow_methods=["GET", "POST", "DELETE", "OPTIONS"],
-    allow_headers=["Content-Type", "Authorization"],
+    allow_headers=["Content-Type", "Authorization", "X-User-Id"],
+    expose_headers=["X-Next-Cursor", "ETag", "Server-Timing"],
 )
 
-# Database connection
-def get_db_connection():
+# Cache for aggregate responses, cleared whenever trips change
+response_cache = create_response_cache()
+
+# Place and category lookups from the assistant's free-text queries
+query_service = create_query_service()
+
+# Prometheus metrics served at /metrics
+metrics_registry = Registry()
+request_duration = metrics_registry.histogram(
+    'ecotracker_http_request_duration_seconds',
+    'Time to handle a request, up to the start of the response body',
+    ['method', 'route', 'status']
+)
+request_db_queries = metrics_registry.counter(
+    'ecotracker_http_request_db_queries_total', 'Database queries run while handling requests', ['route']
+)
+request_db_seconds = metrics_registry.counter(
+    'ecotracker_http_request_db_seconds_total', 'Time spent in database queries while handling requests', ['route']
+)
+db_query_duration = metrics_registry.histogram('ecotracker_db_query_duration_seconds', 'Time taken by each database query')
+db_pool_wait = metrics_registry.histogram('ecotracker_db_pool_wait_seconds', 'Time spent waiting for a pooled connection')
+db_pool_timeouts = metrics_registry.counter('ecotracker_db_pool_timeouts_total', 'Requests that gave up waiting for a connection')
+metrics_registry.callback(
+    'ecotracker_db_pool_connections', 'Pooled database connections by state',
+    lambda: {('in_use',): len(db_pool._used), ('idle',): len(db_pool._pool)} if db_pool else {}, ['state']
+)
+metrics_registry.callback('ecotracker_db_pool_max_connections', 'Most connections the pool will open', lambda: DB_POOL_MAX_SIZE)
+metrics_registry.callback(
+    'ecotracker_cache_hits_total', 'Lookups answered from a cache',
+    lambda: {
+        ('response',): response_cache.hits,
+        ('query',): query_service.cache_hits,
+        ('route',): route_calculator.hits
+    }, ['cache'], type='counter'
+)
+metrics_registry.callback(
+    'ecotracker_cache_misses_total', 'Lookups a cache could not answer',
+    lambda: {
+        ('response',): response_cache.misses,
+        ('query',): query_service.requests - query_service.cache_hits,
+        ('route',): route_calculator.misses
+    }, ['cache'], type='counter'
+)
+metrics_registry.callback(
+    'ecotracker_query_answers_total', 'Uncached assistant queries by how they were answered',
+    lambda: {
+        ('classifier',): query_service.fast_hits,
+        ('llm',): query_service.llm_queries,
+        ('coalesced',): query_service.coalesced
+    }, ['source'], type='counter'
+)
+
+# Add a Server-Timing header with each response's database and total time
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '').lower() in ('1', 'true', 'yes')
+
+# Duration is measured to the start of the response. Database totals are
+# recorded once the body has been sent, so queries run while a streamed
+# response (NDJSON export, event stream) is generated count for its route;
+# its Server-Timing header only covers queries run before streaming began.
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    stats = RequestStats()
+    token = current_request_stats.set(stats)
+    start = time.perf_counter()
+    status = 500
     try:
-        conn = psycopg2.connect(
-            user='postgres',
-            host='localhost',
-            database='DB_Name',
-            password='DB_Password',
-            port='5432',
+        response = await call_next(request)
+        status = response.status_code
+    except Exception:
+        record_request_db_stats(request, stats)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        current_request_stats.reset(token)
+        request_duration.observe(elapsed, request.method, request_route_path(request), status)
+
+    if SERVER_TIMING:
+        response.headers['Server-Timing'] = (
+            f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.db_queries} queries", '
+            f'total;dur={elapsed * 1000:.1f}'
+        )
+
+    body_iterator = response.body_iterator
+
+    async def body_then_record():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            record_request_db_stats(request, stats)
+
+    response.body_iterator = body_then_record()
+    return response
+
+# Label by route template so /api/trips/heatmap/{z}/{x}/{y} is one series
+def request_route_path(request: Request):
+    route = request.scope.get('route')
+    return route.path if route else 'unmatched'
+
+def record_request_db_stats(request: Request, stats):
+    path = request_route_path(request)
+    request_db_queries.inc(path, amount=stats.db_queries)
+    request_db_seconds.inc(path, amount=stats.db_seconds)
+
+# Database configuration
+DB_CONFIG = {
+    'user': os.environ.get('DB_USER', 'postgres'),
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'database': os.environ.get('DB_NAME', 'DB_Name'),
+    'password': os.environ.get('DB_PASSWORD', 'DB_Password'),
+    'port': os.environ.get('DB_PORT', '5432'),
+}
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '2'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '10'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '30'))
+# Connections idle longer than this are pinged before being handed out
+DB_POOL_HEALTHCHECK_IDLE = float(os.environ.get('DB_POOL_HEALTHCHECK_IDLE', '30'))
+
+class TripsConnectionPool(ThreadedConnectionPool):
+    # psycopg2 closes returned connections once minconn are idle; keep up to
+    # maxconn open so connections (and their prepared statements) are reused
+    def _putconn(self, conn, key=None, close=False):
+        minconn = self.minconn
+        self.minconn = self.maxconn
+        try:
+            super()._putconn(conn, key, close)
+        finally:
+            self.minconn = minconn
+
+def record_db_query(seconds):
+    db_query_duration.observe(seconds)
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.record_query(seconds)
+
+# Cursor used by every helper; times each query for /metrics and the
+# Server-Timing header of the request it runs for
+class TimedCursor(RealDictCursor):
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_db_query(time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_db_query(time.perf_counter() - start)
 
+    def copy_expert(self, sql, file, size=8192):
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            record_db_query(time.perf_counter() - start)
 
+# Shared connection pool, created on startup and closed on shutdown
+db_pool = None
+# Bounds concurrent checkouts so callers wait instead of exhausting the pool
+db_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_SIZE)
+# Last time each pooled connection was returned
+db_conn_last_used = weakref.WeakKeyDictionary()
+# Pooled connections on which the insert statement has been prepared
+prepared_connections = weakref.WeakSet()
 
-            cursor_factory=RealDictCursor
+def init_db_pool():
+    global db_pool
+    if db_pool is not None:
+        return db_pool
+    try:
+        db_pool = TripsConnectionPool(
+            DB_POOL_MIN_SIZE,
+            DB_POOL_MAX_SIZE,
+            cursor_factory=TimedCursor,
+            **DB_CONFIG
         )
+        print(f'Database pool created (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})')
+        return db_pool
+    except Exception as e:
+        print(f"Error creating the database pool: {e}")
+        raise
+
+def close_db_pool():
+    global db_pool
+    if db_pool is not None:
+        db_pool.closeall()
+        db_pool = None
+        db_conn_last_used.clear()
+        prepared_connections.clear()
+        print('Database pool closed')
+
+# Check that a pooled connection is still usable before handing it out
+def is_connection_healthy(conn):
+    if conn.closed:
+        return False
+    last_used = db_conn_last_used.get(conn)
+    if last_used is not None and time.monotonic() - last_used < DB_POOL_HEALTHCHECK_IDLE:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+# Database connection
+def get_db_connection():
+    if db_pool is None:
+        init_db_pool()
+    start = time.perf_counter()
+    acquired = db_pool_slots.acquire(timeout=DB_POOL_TIMEOUT)
+    db_pool_wait.observe(time.perf_counter() - start)
+    if not acquired:
+        db_pool_timeouts.inc()
+        raise RuntimeError("Timed out waiting for a database connection")
+    try:
+        conn = db_pool.getconn()
+        if not is_connection_healthy(conn):
+            db_pool.putconn(conn, close=True)
+            conn = db_pool.getconn()
         return conn
     except Exception as e:
+        db_pool_slots.release()
         print(f"Error connecting to the database: {e}")
         raise
 
+# Return a connection to the pool
+def release_db_connection(conn):
+    try:
+        if db_pool is not None:
+            if not conn.closed:
+                db_conn_last_used[conn] = time.monotonic()
+            db_pool.putconn(conn, close=conn.closed != 0)
+        else:
+            conn.close()
+    finally:
+        db_pool_slots.release()
+
+# SQL twin of geohash.encode()
+GEOHASH_FUNCTION_SQL = """
+    CREATE OR REPLACE FUNCTION geohash_encode(lat FLOAT, lon FLOAT, hash_precision INT)
+    RETURNS TEXT AS $f$
+    DECLARE
+        base32 CONSTANT TEXT := '0123456789bcdefghjkmnpqrstuvwxyz';
+        lat_min FLOAT := -90;
+        lat_max FLOAT := 90;
+        lon_min FLOAT := -180;
+        lon_max FLOAT := 180;
+        mid FLOAT;
+        hash TEXT := '';
+        bits INT := 0;
+        ch INT := 0;
+        even BOOLEAN := TRUE;
+    BEGIN
+        IF lat IS NULL OR lon IS NULL THEN
+            RETURN NULL;
+        END IF;
+        WHILE length(hash) < hash_precision LOOP
+            IF even THEN
+                mid := (lon_min + lon_max) / 2;
+                IF lon >= mid THEN
+                    ch := ch * 2 + 1;
+                    lon_min := mid;
+                ELSE
+                    ch := ch * 2;
+                    lon_max := mid;
+                END IF;
+            ELSE
+                mid := (lat_min + lat_max) / 2;
+                IF lat >= mid THEN
+                    ch := ch * 2 + 1;
+                    lat_min := mid;
+                ELSE
+                    ch := ch * 2;
+                    lat_max := mid;
+                END IF;
+            END IF;
+            even := NOT even;
+            bits := bits + 1;
+            IF bits = 5 THEN
+                hash := hash || substr(base32, ch + 1, 1);
+                bits := 0;
+                ch := 0;
+            END IF;
+        END LOOP;
+        RETURN hash;
+    END
+    $f$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
+"""
+
+# Trips belong to the user named by the X-User-Id header, which an
+# authenticating proxy in front of the API is expected to set. Requests
+# without it, and trips stored before trips were per user, belong to
+# DEFAULT_USER_ID.
+DEFAULT_USER_ID = os.environ.get('DEFAULT_USER_ID', 'anonymous')
+USER_ID_PATTERN = re.compile(r'[A-Za-z0-9_.@-]{1,64}')
+
+# Adds the owner and emission factor version columns to a trips table
+# created before they existed. Trips without a factor version predate
+# versioning and are recomputed by the next job.
+ADD_TRIPS_COLUMNS_SQL = """
+    ALTER TABLE IF EXISTS trips ADD COLUMN IF NOT EXISTS user_id TEXT NOT NULL DEFAULT %(default_user_id)s;
+    ALTER TABLE IF EXISTS trips ADD COLUMN IF NOT EXISTS factor_version INT;
+"""
+
+# Opt-in range partitioning of trips by visitdate, one partition per month
+TRIPS_PARTITIONED = os.environ.get('TRIPS_PARTITIONED', '').lower() in ('1', 'true', 'yes')
+TRIPS_PARTITION_MONTHS_AHEAD = int(os.environ.get('TRIPS_PARTITION_MONTHS_AHEAD', '3'))
+TRIPS_PARTITION_INTERVAL = float(os.environ.get('TRIPS_PARTITION_INTERVAL', '86400'))
+
+# Same columns as the plain table; the key must include the partition column
+PARTITIONED_TRIPS_TABLE_SQL = """
+    CREATE TABLE {name} (
+        id INT NOT NULL DEFAULT nextval('trips_id_seq'),
+        category TEXT NOT NULL,
+        location TEXT NOT NULL,
+        latitude FLOAT,
+        longitude FLOAT,
+        visitdate DATE NOT NULL,
+        transportMode TEXT NOT NULL,
+        status TEXT NOT NULL,
+        distance FLOAT,
+        actual_emissions FLOAT,
+        saved_emissions FLOAT,
+        ecoscore float,
+        created_at TIMESTAMP DEFAULT NOW(),
+        user_id TEXT NOT NULL DEFAULT %(default_user_id)s,
+        factor_version INT,
+        PRIMARY KEY (id, visitdate)
+    ) PARTITION BY RANGE (visitdate);
+    CREATE TABLE IF NOT EXISTS trips_default PARTITION OF {name} DEFAULT;
+"""
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+# Monthly partitions from first_month up to and including last_month. Rows
+# already sitting in the default partition for a new month are moved into it.
+def create_trip_partitions(cur, first_month, last_month, table='trips'):
+    columns = ', '.join(['id'] + TRIP_INSERT_COLUMNS + ['created_at'])
+    month = date(first_month.year, first_month.month, 1)
+    created = []
+    while month <= last_month:
+        name = f"trips_p{month:%Y_%m}"
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL as present", (name,))
+        if not cur.fetchone()['present']:
+            bounds = {'start': month, 'end': add_months(month, 1)}
+            cur.execute(f"""
+                CREATE TEMP TABLE trips_partition_move ON COMMIT DROP AS
+                SELECT {columns} FROM trips_default
+                WHERE visitdate >= %(start)s AND visitdate < %(end)s
+            """, bounds)
+            cur.execute("DELETE FROM trips_default WHERE visitdate >= %(start)s AND visitdate < %(end)s", bounds)
+            cur.execute(f"""
+                CREATE TABLE {name} PARTITION OF {table}
+                FOR VALUES FROM (%(start)s) TO (%(end)s)
+            """, bounds)
+            cur.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM trips_partition_move")
+            cur.execute("DROP TABLE trips_partition_move")
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+# Partitions from the earliest month with trips in the default partition,
+# or this month if it has none, through TRIPS_PARTITION_MONTHS_AHEAD months
+# ahead, so trips saved for past months do not stay in trips_default
+def create_current_trip_partitions(cur):
+    this_month = date.today().replace(day=1)
+    cur.execute("SELECT MIN(visitdate) as first_visit FROM trips_default")
+    first_visit = cur.fetchone()['first_visit']
+    first_month = min(first_visit or this_month, this_month)
+    return create_trip_partitions(cur, first_month, add_months(this_month, TRIPS_PARTITION_MONTHS_AHEAD))
+
+# Create trips as a partitioned table, or convert an existing plain trips
+# table in place. The conversion copies every row inside one transaction,
+# so on a large table it should run during a quiet period.
+def partition_trips_table(cur):
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('trips')")
+    row = cur.fetchone()
+    if row and row['relkind'] == 'p':
+        return
+
+    this_month = date.today().replace(day=1)
+    last_month = add_months(this_month, TRIPS_PARTITION_MONTHS_AHEAD)
+    if not row:
+        cur.execute("CREATE SEQUENCE IF NOT EXISTS trips_id_seq")
+        cur.execute(PARTITIONED_TRIPS_TABLE_SQL.format(name='trips'), {'default_user_id': DEFAULT_USER_ID})
+        cur.execute("ALTER SEQUENCE trips_id_seq OWNED BY trips.id")
+        create_current_trip_partitions(cur)
+        return
+
+    columns = ', '.join(['id'] + TRIP_INSERT_COLUMNS + ['created_at'])
+    cur.execute(PARTITIONED_TRIPS_TABLE_SQL.format(name='trips_partitioned'), {'default_user_id': DEFAULT_USER_ID})
+    cur.execute("SELECT MIN(visitdate) as first_visit FROM trips")
+    first_visit = cur.fetchone()['first_visit']
+    create_trip_partitions(cur, min(first_visit or this_month, this_month), last_month, 'trips_partitioned')
+    cur.execute(f"INSERT INTO trips_partitioned ({columns}) SELECT {columns} FROM trips")
+    cur.execute("""
+        ALTER SEQUENCE trips_id_seq OWNED BY NONE;
+        DROP TABLE trips;
+        ALTER TABLE trips_partitioned RENAME TO trips;
+        ALTER INDEX trips_partitioned_pkey RENAME TO trips_pkey;
+        ALTER SEQUENCE trips_id_seq OWNED BY trips.id;
+    """)
+    print('Converted trips to a table partitioned by visitdate')
+
+# Keep TRIPS_PARTITION_MONTHS_AHEAD months of partitions ready and move
+# trips for past months out of the default partition
+def create_upcoming_trip_partitions():
+    conn = None
+    cur = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        created = create_current_trip_partitions(cur)
+        conn.commit()
+        return created
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"Error creating trip partitions: {e}")
+        raise
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
+
 # Initialize database
 def initialize_database():
     try:
         conn = get_db_connection()
         cur = conn.cursor()
+        cur.execute(ADD_TRIPS_COLUMNS_SQL, {'default_user_id': DEFAULT_USER_ID})
+        # Before the DO block so its indexes land on the partitioned table
+        if TRIPS_PARTITIONED:
+            partition_trips_table(cur)
         cur.execute('''
             DO $$
             BEGIN
@@ -99,90 +541,321 @@ def initialize_database():
                     actual_emissions FLOAT,
                     saved_emissions FLOAT,
                     ecoscore float,
+                    created_at TIMESTAMP DEFAULT NOW(),
+                    user_id TEXT NOT NULL DEFAULT %(default_user_id)s,
+                    factor_version INT
+                );
+
+                CREATE INDEX IF NOT EXISTS idx_trips_status ON trips (status);
+                CREATE INDEX IF NOT EXISTS idx_trips_status_visitdate ON trips (status, visitdate);
+                -- Reads are for one user at a time, so user_id leads the
+                -- date range, keyset pagination and location indexes
+                CREATE INDEX IF NOT EXISTS idx_trips_user_visitdate ON trips (user_id, visitdate);
+                CREATE INDEX IF NOT EXISTS idx_trips_user_created_at_id ON trips (user_id, created_at, id);
+                CREATE INDEX IF NOT EXISTS idx_trips_user_location ON trips (user_id, location);
+                DROP INDEX IF EXISTS idx_trips_visitdate;
+                DROP INDEX IF EXISTS idx_trips_created_at_id;
+                DROP INDEX IF EXISTS idx_trips_location;
+
+                -- Per-user rollups kept current by save_trip, clear_data and
+                -- update_trip_statuses; backfilled once when first created
+                IF to_regclass('trip_mode_rollup') IS NULL THEN
+                    CREATE TABLE trip_mode_rollup (
+                        user_id TEXT NOT NULL,
+                        transportMode TEXT NOT NULL,
+                        trip_count BIGINT NOT NULL DEFAULT 0,
+                        actual_emissions FLOAT NOT NULL DEFAULT 0,
+                        saved_emissions FLOAT NOT NULL DEFAULT 0,
+                        distance FLOAT NOT NULL DEFAULT 0,
+                        ecoscore_sum FLOAT NOT NULL DEFAULT 0,
+                        ecoscore_count BIGINT NOT NULL DEFAULT 0,
+                        PRIMARY KEY (user_id, transportMode)
+                    );
+                    INSERT INTO trip_mode_rollup
+                        (user_id, transportMode, trip_count, actual_emissions, saved_emissions,
+                         distance, ecoscore_sum, ecoscore_count)
+                    SELECT user_id, transportMode, COUNT(*), COALESCE(SUM(actual_emissions), 0),
+                           COALESCE(SUM(saved_emissions), 0), COALESCE(SUM(distance), 0),
+                           COALESCE(SUM(ecoscore), 0), COUNT(ecoscore)
+                    FROM trips GROUP BY user_id, transportMode;
+                ELSIF NOT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'trip_mode_rollup' AND column_name = 'user_id'
+                ) THEN
+                    -- Global rollups from before trips were per user cover
+                    -- exactly the trips now owned by the default user
+                    ALTER TABLE trip_mode_rollup ADD COLUMN user_id TEXT NOT NULL DEFAULT %(default_user_id)s;
+                    ALTER TABLE trip_mode_rollup ALTER COLUMN user_id DROP DEFAULT;
+                    ALTER TABLE trip_mode_rollup DROP CONSTRAINT trip_mode_rollup_pkey;
+                    ALTER TABLE trip_mode_rollup ADD PRIMARY KEY (user_id, transportMode);
+                END IF;
+
+                IF to_regclass('trip_visitdate_rollup') IS NULL THEN
+                    CREATE TABLE trip_visitdate_rollup (
+                        user_id TEXT NOT NULL,
+                        visitdate DATE NOT NULL,
+                        trip_count BIGINT NOT NULL DEFAULT 0,
+                        pending_count BIGINT NOT NULL DEFAULT 0,
+                        completed_count BIGINT NOT NULL DEFAULT 0,
+                        actual_emissions FLOAT NOT NULL DEFAULT 0,
+                        saved_emissions FLOAT NOT NULL DEFAULT 0,
+                        distance FLOAT NOT NULL DEFAULT 0,
+                        ecoscore_sum FLOAT NOT NULL DEFAULT 0,
+                        ecoscore_count BIGINT NOT NULL DEFAULT 0,
+                        PRIMARY KEY (user_id, visitdate)
+                    );
+                    INSERT INTO trip_visitdate_rollup
+                        (user_id, visitdate, trip_count, pending_count, completed_count,
+                         actual_emissions, saved_emissions, distance, ecoscore_sum, ecoscore_count)
+                    SELECT user_id, visitdate, COUNT(*),
+                           COUNT(*) FILTER (WHERE status = 'pending'),
+                           COUNT(*) FILTER (WHERE status = 'completed'),
+                           COALESCE(SUM(actual_emissions), 0), COALESCE(SUM(saved_emissions), 0),
+                           COALESCE(SUM(distance), 0), COALESCE(SUM(ecoscore), 0), COUNT(ecoscore)
+                    FROM trips GROUP BY user_id, visitdate;
+                ELSIF NOT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'trip_visitdate_rollup' AND column_name = 'user_id'
+                ) THEN
+                    ALTER TABLE trip_visitdate_rollup ADD COLUMN user_id TEXT NOT NULL DEFAULT %(default_user_id)s;
+                    ALTER TABLE trip_visitdate_rollup ALTER COLUMN user_id DROP DEFAULT;
+                    ALTER TABLE trip_visitdate_rollup DROP CONSTRAINT trip_visitdate_rollup_pkey;
+                    ALTER TABLE trip_visitdate_rollup ADD PRIMARY KEY (user_id, visitdate);
+                END IF;
+
+                CREATE TABLE IF NOT EXISTS emission_factor_versions (
+                    version SERIAL PRIMARY KEY,
+                    factors JSONB NOT NULL,
                     created_at TIMESTAMP DEFAULT NOW()
                 );
+
+                -- Recompute progress is checkpointed in last_id so jobs resume
+                CREATE TABLE IF NOT EXISTS recompute_jobs (
+                    id SERIAL PRIMARY KEY,
+                    factor_version INT NOT NULL REFERENCES emission_factor_versions (version),
+                    last_id INT NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'running',
+                    started_at TIMESTAMP DEFAULT NOW(),
+                    updated_at TIMESTAMP DEFAULT NOW(),
+                    finished_at TIMESTAMP,
+                    failures INT NOT NULL DEFAULT 0,
+                    last_error TEXT
+                );
+                -- Jobs now select trips by factor_version instead of an id ceiling
+                ALTER TABLE recompute_jobs DROP COLUMN IF EXISTS max_id;
+                ALTER TABLE recompute_jobs ADD COLUMN IF NOT EXISTS failures INT NOT NULL DEFAULT 0;
+                ALTER TABLE recompute_jobs ADD COLUMN IF NOT EXISTS last_error TEXT;
             END $$;
-        ''')
+        ''', {'default_user_id': DEFAULT_USER_ID})
+        # Geohash of each trip's coordinates, kept in a generated column
+        # so every insert path fills it and existing rows are backfilled
+        cur.execute(GEOHASH_FUNCTION_SQL)
+        cur.execute(f"""
+            ALTER TABLE trips ADD COLUMN IF NOT EXISTS geohash TEXT
+                GENERATED ALWAYS AS (geohash_encode(latitude, longitude, {geohash.MAX_PRECISION})) STORED;
+            CREATE INDEX IF NOT EXISTS idx_trips_user_geohash ON trips (user_id, geohash text_pattern_ops);
+            DROP INDEX IF EXISTS idx_trips_geohash;
+        """)
+        # The hard-coded factors become version 1
+        cur.execute("""
+            INSERT INTO emission_factor_versions (factors)
+            SELECT %s WHERE NOT EXISTS (SELECT 1 FROM emission_factor_versions)
+        """, (Json(EMISSION_FACTORS),))
         conn.commit()
         print('Database initialized')
-        update_trip_statuses()
     except Exception as error:
         print('Error initializing database:', error)
     finally:
         if 'cur' in locals() and cur:
             cur.close()
         if 'conn' in locals() and conn:
-            conn.close()
+            release_db_connection(conn)
+
+# Emission factors applied to new trips; refreshed from emission_factor_versions
+active_emission_factors = {'version': None, 'factors': dict(EMISSION_FACTORS)}
+
+# Recompute throttling: trips per chunk and pause between chunks, longer
+# during business hours so the job never holds trips locks for long
+RECOMPUTE_CHUNK_SIZE = int(os.environ.get('RECOMPUTE_CHUNK_SIZE', '5000'))
+RECOMPUTE_DELAY = float(os.environ.get('RECOMPUTE_DELAY', '0.05'))
+RECOMPUTE_BUSINESS_DELAY = float(os.environ.get('RECOMPUTE_BUSINESS_DELAY', '1.0'))
+RECOMPUTE_BUSINESS_HOURS = tuple(int(hour) for hour in os.environ.get('RECOMPUTE_BUSINESS_HOURS', '9-18').split('-'))
+# A failed chunk (a deadlock, a pool timeout) is retried after
+# RECOMPUTE_RETRY_DELAY seconds, doubling each time, up to
+# RECOMPUTE_MAX_RETRIES times. The scheduler then picks the job up again
+# every RECOMPUTE_RESUME_INTERVAL seconds.
+RECOMPUTE_RETRY_DELAY = float(os.environ.get('RECOMPUTE_RETRY_DELAY', '1.0'))
+RECOMPUTE_MAX_RETRIES = int(os.environ.get('RECOMPUTE_MAX_RETRIES', '5'))
+RECOMPUTE_RESUME_INTERVAL = float(os.environ.get('RECOMPUTE_RESUME_INTERVAL', '60'))
+
+# Set on shutdown so running recompute jobs stop after their current chunk
+recompute_stop = threading.Event()
+# Recompute threads running in this process, keyed by job id
+recompute_threads = {}
+recompute_threads_lock = threading.Lock()
+
+# Periodic background tasks, in seconds between runs
+STATUS_UPDATE_INTERVAL = float(os.environ.get('STATUS_UPDATE_INTERVAL', '300'))
+FACTORS_REFRESH_INTERVAL = float(os.environ.get('FACTORS_REFRESH_INTERVAL', '60'))
+
+# Set on shutdown so scheduled tasks stop
+scheduler_stop = threading.Event()
+# Scheduled tasks and their last-run timing, keyed by task name
+scheduled_tasks = {}
+
+# Trip changes are announced with NOTIFY on this channel when their
+# transaction commits; every worker LISTENs and pushes them to /api/stream
+TRIP_EVENTS_CHANNEL = 'trip_events'
+STREAM_KEEPALIVE = float(os.environ.get('STREAM_KEEPALIVE', '15'))
+trip_events = Broadcaster()
+trip_events_stop = threading.Event()
+trip_events_thread = None
+
+# Points of interest for /api/nearby: a local GeoJSON path or a WFS URL
+POI_SOURCE = os.environ.get(
+    'POI_SOURCE',
+    'http://localhost:8080/geoserver/wfs?service=WFS&version=1.0.0&request=GetFeature'
+    '&typeName=routing:ahm_point&outputFormat=application/json'
+)
+POI_REFRESH_INTERVAL = float(os.environ.get('POI_REFRESH_INTERVAL', '3600'))
+
+# Spatial index over the POIs, swapped wholesale on each refresh
+poi_index = POIIndex([])
+
+# Road network for trip distances: a local GeoJSON path or a WFS URL of
+# road lines. Without one, distances are great-circle.
+ROAD_GRAPH_SOURCE = os.environ.get('ROAD_GRAPH_SOURCE')
+ROAD_GRAPH_REFRESH_INTERVAL = float(os.environ.get('ROAD_GRAPH_REFRESH_INTERVAL', '86400'))
+# Route cache: endpoints snapped to a grid of this many degrees (about
+# 110 m), and how far an endpoint may be from the nearest road
+ROUTE_CACHE_GRID = float(os.environ.get('ROUTE_CACHE_GRID', '0.001'))
+ROUTE_CACHE_MAX_ENTRIES = int(os.environ.get('ROUTE_CACHE_MAX_ENTRIES', '10000'))
+ROUTE_MAX_SNAP_M = float(os.environ.get('ROUTE_MAX_SNAP_M', '500'))
+# Shortest distance stored for a worked-out trip, so a visit logged from
+# the place itself is not rounded to 0 km and rejected
+MIN_TRIP_DISTANCE_KM = 0.01
+
+route_calculator = RouteCalculator(None, ROUTE_CACHE_GRID, ROUTE_CACHE_MAX_ENTRIES, ROUTE_MAX_SNAP_M)
+
+# Columns written when a trip is inserted
+TRIP_INSERT_COLUMNS = [
+    'category', 'location', 'latitude', 'longitude', 
+    'visitdate', 'transportMode', 'status', 
+    'distance', 'actual_emissions', 'saved_emissions', 'ecoscore', 'user_id',
+    'factor_version'
+]
+
+# Server-side prepared insert, parameter types in TRIP_INSERT_COLUMNS order
+INSERT_TRIP_PREPARE = f"""
+    PREPARE insert_trip (text, text, float8, float8, date, text, text, float8, float8, float8, float8, text, int4) AS
+    INSERT INTO trips ({', '.join(TRIP_INSERT_COLUMNS)})
+    VALUES ({', '.join(f'${i}' for i in range(1, len(TRIP_INSERT_COLUMNS) + 1))})
+    RETURNING *
+"""
+INSERT_TRIP_EXECUTE = f"EXECUTE insert_trip ({', '.join(['%s'] * len(TRIP_INSERT_COLUMNS))})"
+
+# Queue a trip event for delivery when the current transaction commits.
+# Events without a user_id reach every user's stream. NOTIFY payloads must
+# stay under 8000 bytes, so events carry ids rather than whole rows.
+def notify_trip_event(cur, event_type, user_id=None, **data):
+    payload = json.dumps(dict(data, type=event_type, user_id=user_id), default=str)
+    cur.execute("SELECT pg_notify(%s, %s)", (TRIP_EVENTS_CHANNEL, payload))
+
+# Fill in the calculated columns of a trip before it is inserted
+def prepare_trip_data(trip_data: Dict):
+    # Version before factors, see load_active_emission_factors
+    trip_data['factor_version'] = active_emission_factors['version']
+    actual_emission, emissions_saved, eco_score = calculate_trip_emissions(
+        trip_data.get('distance', 0), trip_data.get('transportMode', ''),
+        active_emission_factors['factors']
+    )
+    
+    # Prepare trip data with calculated values
+    trip_data['actual_emissions'] = actual_emission
+    trip_data['saved_emissions'] = emissions_saved
+    trip_data['ecoscore'] = eco_score
+    
+    # Default status to 'pending' if not provided
+    trip_data['status'] = trip_data.get('status', 'pending')
+    return trip_data
+
+# Add a newly inserted trip to the rollup tables (caller owns the transaction)
+def apply_trip_to_rollups(cur, trip):
+    ecoscore = trip['ecoscore'] if trip['ecoscore'] is not None else 0
+    ecoscore_count = 0 if trip['ecoscore'] is None else 1
+    cur.execute("""
+        INSERT INTO trip_mode_rollup AS r
+            (user_id, transportMode, trip_count, actual_emissions, saved_emissions, distance, ecoscore_sum, ecoscore_count)
+        VALUES (%s, %s, 1, %s, %s, %s, %s, %s)
+        ON CONFLICT (user_id, transportMode) DO UPDATE SET
+            trip_count = r.trip_count + 1,
+            actual_emissions = r.actual_emissions + EXCLUDED.actual_emissions,
+            saved_emissions = r.saved_emissions + EXCLUDED.saved_emissions,
+            distance = r.distance + EXCLUDED.distance,
+            ecoscore_sum = r.ecoscore_sum + EXCLUDED.ecoscore_sum,
+            ecoscore_count = r.ecoscore_count + EXCLUDED.ecoscore_count
+    """, (
+        trip['user_id'], trip['transportmode'], trip['actual_emissions'] or 0, trip['saved_emissions'] or 0,
+        trip['distance'] or 0, ecoscore, ecoscore_count
+    ))
+    cur.execute("""
+        INSERT INTO trip_visitdate_rollup AS r
+            (user_id, visitdate, trip_count, pending_count, completed_count, actual_emissions,
+             saved_emissions, distance, ecoscore_sum, ecoscore_count)
+        VALUES (%s, %s, 1, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (user_id, visitdate) DO UPDATE SET
+            trip_count = r.trip_count + 1,
+            pending_count = r.pending_count + EXCLUDED.pending_count,
+            completed_count = r.completed_count + EXCLUDED.completed_count,
+            actual_emissions = r.actual_emissions + EXCLUDED.actual_emissions,
+            saved_emissions = r.saved_emissions + EXCLUDED.saved_emissions,
+            distance = r.distance + EXCLUDED.distance,
+            ecoscore_sum = r.ecoscore_sum + EXCLUDED.ecoscore_sum,
+            ecoscore_count = r.ecoscore_count + EXCLUDED.ecoscore_count
+    """, (
+        trip['user_id'], trip['visitdate'], 1 if trip['status'] == 'pending' else 0,
+        1 if trip['status'] == 'completed' else 0, trip['actual_emissions'] or 0,
+        trip['saved_emissions'] or 0, trip['distance'] or 0, ecoscore, ecoscore_count
+    ))
+
+# Fill in a trip's distance in km from its origin to its coordinates when
+# the client did not send one
+def resolve_trip_distance(trip_data: Dict):
+    origin_latitude = trip_data.pop('originLatitude', None)
+    origin_longitude = trip_data.pop('originLongitude', None)
+    if trip_data.get('distance') is not None:
+        return trip_data
+    if None in (origin_latitude, origin_longitude, trip_data.get('latitude'), trip_data.get('longitude')):
+        raise ValueError("distance is required unless originLatitude, originLongitude, latitude and longitude are given")
+    distance, _ = route_calculator.distance_km(
+        origin_latitude, origin_longitude, trip_data['latitude'], trip_data['longitude']
+    )
+    trip_data['distance'] = max(round(distance, 2), MIN_TRIP_DISTANCE_KM)
+    return trip_data
 
 # Save trip
 def save_trip(trip_data: Dict):
     conn = None
     cur = None
     try:
-        # Calculate emissions and eco-score
-        distance = float(trip_data.get('distance', 0))
-        transport_mode = trip_data.get('transportMode', '').lower()
-        
-        # Prevent division by zero and handle missing mode
-        if distance <= 0 or transport_mode not in EMISSION_FACTORS:
-            raise ValueError(f"Invalid distance or transport mode: {distance}, {transport_mode}")
-        
-        # Calculate actual emissions
-        threshold_emissions = 113  # kg/km
-        actual_emission = (EMISSION_FACTORS.get(transport_mode, 0)) * distance
-        max_emission_reference = EMISSION_FACTORS['bus'] * distance
-        
-        # Calculate emissions saved
-        emissions_saved = max(0, (threshold_emissions - actual_emission / distance) * distance)
-        
-        # Calculate eco-score (0-100 scale)
-        eco_score = max(0, min(100, 100 - (actual_emission / max_emission_reference) * 100))
-        
-        # Prepare trip data with calculated values
-        trip_data['actual_emissions'] = actual_emission
-        trip_data['saved_emissions'] = emissions_saved
-        trip_data['ecoscore'] = eco_score
-        
-        # Default status to 'pending' if not provided
-        trip_data['status'] = trip_data.get('status', 'pending')
-        
-        # Ensure required columns are present
-        required_columns = [
-            'category', 'location', 'latitude', 'longitude', 
-            'visitdate', 'transportMode', 'status', 
-            'distance', 'actual_emissions', 'saved_emissions', 'ecoscore'
-        ]
+        prepare_trip_data(trip_data)
         
-        # Prepare the insert query dynamically
         conn = get_db_connection()
         cur = conn.cursor()
         
-        # Filter out any extra keys and ensure all required columns are present
-        filtered_data = {k: trip_data.get(k) for k in required_columns}
+        # Prepare the insert once per pooled connection, then reuse its plan
+        if conn not in prepared_connections:
+            cur.execute(INSERT_TRIP_PREPARE)
+            prepared_connections.add(conn)
         
-        # Create the columns and values for the SQL query
-        columns = ', '.join(filtered_data.keys())
-        
-        # Handle different data types for SQL insertion
-        def format_value(value):
-            if value is None:
-                return 'NULL'
-            elif isinstance(value, (int, float)):
-                return str(value)
-            elif isinstance(value, date):
-                return f"'{value.isoformat()}'"
-            else:
-                return f"'{str(value)}'"
-        
-        values = ', '.join(format_value(filtered_data[col]) for col in filtered_data.keys())
-        
-        # Execute the insert query
-        query = f"INSERT INTO trips ({columns}) VALUES ({values}) RETURNING *"
-        cur.execute(query)
+        cur.execute(INSERT_TRIP_EXECUTE, [trip_data.get(k) for k in TRIP_INSERT_COLUMNS])
         
         # Fetch and return the inserted row
         result = dict(cur.fetchone())
+        apply_trip_to_rollups(cur, result)
+        notify_trip_event(cur, 'trip_created', result['user_id'], id=result['id'], visitdate=result['visitdate'])
         conn.commit()
+        response_cache.invalidate(result['user_id'])
         
         return result
     
@@ -197,27 +870,240 @@ def save_trip(trip_data: Dict):
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_db_connection(conn)
+
+# One CSV field for COPY: None is the unquoted NULL marker and every other
+# value is quoted, so empty strings stay empty strings instead of NULL
+def copy_csv_field(value):
+    if value is None:
+        return '\\N'
+    return '"' + str(value).replace('"', '""') + '"'
+
+# Save many trips in one transaction, loading them with COPY
+def save_trips_bulk(trips_data: List[Dict]):
+    conn = None
+    cur = None
+    try:
+        buffer = io.StringIO()
+        for trip_data in trips_data:
+            buffer.write(','.join(copy_csv_field(trip_data.get(column)) for column in TRIP_INSERT_COLUMNS) + '\n')
+        buffer.seek(0)
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        columns = ', '.join(TRIP_INSERT_COLUMNS)
+
+        cur.execute(f"""
+            CREATE TEMP TABLE trips_staging ON COMMIT DROP AS
+            SELECT {columns} FROM trips WITH NO DATA
+        """)
+        cur.copy_expert(f"COPY trips_staging ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+        cur.execute(f"INSERT INTO trips ({columns}) SELECT {columns} FROM trips_staging RETURNING id")
+        ids = [row['id'] for row in cur.fetchall()]
+
+        # Fold the whole batch into the rollups with one upsert per table
+        cur.execute("""
+            INSERT INTO trip_mode_rollup AS r
+                (user_id, transportMode, trip_count, actual_emissions, saved_emissions, distance, ecoscore_sum, ecoscore_count)
+            SELECT user_id, transportMode, COUNT(*), COALESCE(SUM(actual_emissions), 0),
+                   COALESCE(SUM(saved_emissions), 0), COALESCE(SUM(distance), 0),
+                   COALESCE(SUM(ecoscore), 0), COUNT(ecoscore)
+            FROM trips_staging GROUP BY user_id, transportMode
+            ON CONFLICT (user_id, transportMode) DO UPDATE SET
+                trip_count = r.trip_count + EXCLUDED.trip_count,
+                actual_emissions = r.actual_emissions + EXCLUDED.actual_emissions,
+                saved_emissions = r.saved_emissions + EXCLUDED.saved_emissions,
+                distance = r.distance + EXCLUDED.distance,
+                ecoscore_sum = r.ecoscore_sum + EXCLUDED.ecoscore_sum,
+                ecoscore_count = r.ecoscore_count + EXCLUDED.ecoscore_count
+        """)
+        cur.execute("""
+            INSERT INTO trip_visitdate_rollup AS r
+                (user_id, visitdate, trip_count, pending_count, completed_count, actual_emissions,
+                 saved_emissions, distance, ecoscore_sum, ecoscore_count)
+            SELECT user_id, visitdate, COUNT(*),
+                   COUNT(*) FILTER (WHERE status = 'pending'),
+                   COUNT(*) FILTER (WHERE status = 'completed'),
+                   COALESCE(SUM(actual_emissions), 0), COALESCE(SUM(saved_emissions), 0),
+                   COALESCE(SUM(distance), 0), COALESCE(SUM(ecoscore), 0), COUNT(ecoscore)
+            FROM trips_staging GROUP BY user_id, visitdate
+            ON CONFLICT (user_id, visitdate) DO UPDATE SET
+                trip_count = r.trip_count + EXCLUDED.trip_count,
+                pending_count = r.pending_count + EXCLUDED.pending_count,
+                completed_count = r.completed_count + EXCLUDED.completed_count,
+                actual_emissions = r.actual_emissions + EXCLUDED.actual_emissions,
+                saved_emissions = r.saved_emissions + EXCLUDED.saved_emissions,
+                distance = r.distance + EXCLUDED.distance,
+                ecoscore_sum = r.ecoscore_sum + EXCLUDED.ecoscore_sum,
+                ecoscore_count = r.ecoscore_count + EXCLUDED.ecoscore_count
+        """)
+
+        # A batch for one user only touches that user's stream and cache
+        users = {trip_data['user_id'] for trip_data in trips_data}
+        user_id = users.pop() if len(users) == 1 else None
+        notify_trip_event(cur, 'trips_created', user_id, inserted=len(ids))
+        conn.commit()
+        response_cache.invalidate(user_id)
+        return ids
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"Error saving trips in bulk: {e}")
+        raise
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
+
+# Parse a bulk upload body into raw trip dicts
+def parse_bulk_trips(body: bytes, content_type: str):
+    text = body.decode('utf-8')
+    if 'text/csv' in content_type:
+        # Empty CSV cells mean "not provided", not empty strings
+        return [
+            {key: (value if value != '' else None) for key, value in row.items()}
+            for row in csv.DictReader(io.StringIO(text))
+        ]
+    if 'ndjson' in content_type:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    rows = json.loads(text)
+    if not isinstance(rows, list):
+        raise ValueError("Expected a JSON array of trips")
+    return rows
+
+# Validate raw trip dicts and calculate their emissions, collecting per-row errors
+def validate_bulk_trips(rows: List[Dict]):
+    parsed = []
+    errors = []
+    for index, row in enumerate(rows):
+        try:
+            trip_dict = TripCreate(**row).dict(exclude_unset=True)
+            if not trip_dict['category'] or not trip_dict['location']:
+                raise ValueError("category and location must not be empty")
+            parsed.append((index, resolve_trip_distance(trip_dict)))
+        except Exception as e:
+            errors.append({"row": index, "error": str(e)})
+
+    # Calculate emissions for the whole batch in one vectorized call
+    factor_version = active_emission_factors['version']
+    actual, saved, eco_scores, valid_mask = calculate_emissions(
+        [trip_dict['distance'] for _, trip_dict in parsed],
+        [trip_dict['transportMode'] for _, trip_dict in parsed],
+        active_emission_factors['factors']
+    )
+
+    valid = []
+    for position, (index, trip_dict) in enumerate(parsed):
+        if not valid_mask[position]:
+            errors.append({
+                "row": index,
+                "error": f"Invalid distance or transport mode: {trip_dict['distance']}, {trip_dict['transportMode'].lower()}"
+            })
+            continue
+        trip_dict['actual_emissions'] = float(actual[position])
+        trip_dict['saved_emissions'] = float(saved[position])
+        trip_dict['ecoscore'] = float(eco_scores[position])
+        trip_dict['factor_version'] = factor_version
+        valid.append(trip_dict)
+
+    errors.sort(key=lambda error: error['row'])
+    return valid, errors
+
+# Columns that can be requested through the fields projection
+TRIP_COLUMNS = [
+    'id', 'category', 'location', 'latitude', 'longitude', 'visitdate',
+    'transportmode', 'status', 'distance', 'actual_emissions',
+    'saved_emissions', 'ecoscore', 'created_at', 'geohash', 'user_id'
+]
+
+# Rows fetched per round trip by the server-side cursor when streaming
+TRIPS_STREAM_BATCH_SIZE = 1000
+
+def parse_trip_fields(fields):
+    if not fields:
+        return None
+    columns = [field.strip().lower() for field in fields.split(',') if field.strip()]
+    unknown = [column for column in columns if column not in TRIP_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown trip fields: {', '.join(unknown)}")
+    return columns
+
+# Keyset cursors are the (created_at, id) of the last row on a page
+def encode_trip_cursor(row):
+    raw = f"{row['created_at'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_trip_cursor(cursor):
+    try:
+        created_at, trip_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(trip_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+# Conditions restricting a query to one user's trips or rollup rows with
+# visit dates between from and to, inclusive. user_id leads every index
+# they use; on a partitioned trips table the dates also prune partitions.
+def user_conditions(user_id, start_date=None, end_date=None):
+    conditions = ["user_id = %(user_id)s"]
+    params = {'user_id': user_id}
+    if start_date:
+        conditions.append("visitdate >= %(start_date)s")
+        params['start_date'] = start_date
+    if end_date:
+        conditions.append("visitdate <= %(end_date)s")
+        params['end_date'] = end_date
+    return conditions, params
+
+def where_clause(conditions):
+    return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+def build_trips_query(user_id, status=None, cursor=None, columns=None, start_date=None, end_date=None):
+    # id and created_at are always selected so a page can be continued
+    selected = ['id', 'created_at'] + [c for c in columns if c not in ('id', 'created_at')] if columns else ['*']
+    query = f"SELECT {', '.join(selected)} FROM trips"
+    conditions, params = user_conditions(user_id, start_date, end_date)
+
+    if status:
+        conditions.append("status = %(status)s")
+        params['status'] = status
+    if cursor:
+        conditions.append("(created_at, id) < (%(cursor_created_at)s, %(cursor_id)s)")
+        params['cursor_created_at'], params['cursor_id'] = decode_trip_cursor(cursor)
+    query += where_clause(conditions)
+
+    query += " ORDER BY created_at DESC, id DESC"
+    return query, params
+
+def project_trip(row, columns):
+    if not columns:
+        return dict(row)
+    return {column: row[column] for column in columns}
 
 # Get trips
-def get_trips(status=None):
+def get_trips(user_id, status=None, limit=None, cursor=None, fields=None, start_date=None, end_date=None):
     conn = None
     cur = None
     try:
+        columns = parse_trip_fields(fields)
+        query, params = build_trips_query(user_id, status, cursor, columns, start_date, end_date)
+
+        if limit:
+            query += " LIMIT %(limit)s"
+            params['limit'] = limit
+
         conn = get_db_connection()
         cur = conn.cursor()
-        
-        query = "SELECT * FROM trips"
-        params = []
-        
-        if status:
-            query += " WHERE status = %s"
-            params.append(status)
-            
-        query += " ORDER BY created_at DESC"
-        
         cur.execute(query, params)
-        trips = [dict(row) for row in cur.fetchall()]
+        rows = cur.fetchall()
+
+        next_cursor = None
+        if limit and len(rows) == limit:
+            next_cursor = encode_trip_cursor(rows[-1])
+
+        trips = [project_trip(row, columns) for row in rows]
+        if limit:
+            return trips, next_cursor
         return trips
     except Exception as e:
         print(f"Error getting trips: {e}")
@@ -226,7 +1112,31 @@ def get_trips(status=None):
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_db_connection(conn)
+
+# Stream trips as NDJSON lines through a server-side cursor, encoded like
+# the JSON responses so both formats agree on dates and timestamps
+def stream_trips(user_id, status=None, fields=None, start_date=None, end_date=None):
+    columns = parse_trip_fields(fields)
+    query, params = build_trips_query(user_id, status, None, columns, start_date, end_date)
+
+    conn = None
+    cur = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(name='trips_export')
+        cur.itersize = TRIPS_STREAM_BATCH_SIZE
+        cur.execute(query, params)
+        for row in cur:
+            yield json.dumps(jsonable_encoder(project_trip(row, columns))) + "\n"
+    except Exception as e:
+        print(f"Error streaming trips: {e}")
+        raise
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
 
 # Update trip statuses
 def update_trip_statuses():
@@ -236,16 +1146,38 @@ def update_trip_statuses():
         conn = get_db_connection()
         cur = conn.cursor()
         
-        # Update status to 'completed' for past trips
+        # Only one worker needs to run this at a time; the others skip
+        cur.execute("SELECT pg_try_advisory_xact_lock(hashtext('update_trip_statuses')) as locked")
+        if not cur.fetchone()['locked']:
+            conn.rollback()
+            return 0
+        
+        # Update status to 'completed' for trips that became due and move
+        # them between the rollup status counts in the same statement.
+        # The (status, visitdate) index limits the scan to due pending rows.
         cur.execute("""
-            UPDATE trips
-            SET status = 'completed'
-            WHERE visitdate < CURRENT_DATE AND status = 'pending'
-
+            WITH moved AS (
+                UPDATE trips
+                SET status = 'completed'
+                WHERE status = 'pending' AND visitdate < CURRENT_DATE
+                RETURNING user_id, visitdate
+            ), rollup AS (
+                UPDATE trip_visitdate_rollup r
+                SET pending_count = r.pending_count - m.moved_count,
+                    completed_count = r.completed_count + m.moved_count
+                FROM (SELECT user_id, visitdate, COUNT(*) as moved_count FROM moved GROUP BY user_id, visitdate) m
+                WHERE r.user_id = m.user_id AND r.visitdate = m.visitdate
+            )
+            SELECT COUNT(*) as updated FROM moved
         """)
+        updated = cur.fetchone()['updated']
+        if updated:
+            notify_trip_event(cur, 'statuses_updated', updated=updated)
         
         conn.commit()
-        print('Trip statuses updated')
+        if updated:
+            response_cache.invalidate()
+        return updated
     except Exception as e:
         if conn:
             conn.rollback()
@@ -255,17 +1187,26 @@ def update_trip_statuses():
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_db_connection(conn)
 
-# Clear data
-def clear_data():
+# Clear one user's data, or everyone's when no user is given
+def clear_data(user_id=None):
     conn = None
     cur = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute("DELETE FROM trips")
+        if user_id is None:
+            cur.execute("DELETE FROM trips")
+            cur.execute("DELETE FROM trip_mode_rollup")
+            cur.execute("DELETE FROM trip_visitdate_rollup")
+        else:
+            cur.execute("DELETE FROM trips WHERE user_id = %s", (user_id,))
+            cur.execute("DELETE FROM trip_mode_rollup WHERE user_id = %s", (user_id,))
+            cur.execute("DELETE FROM trip_visitdate_rollup WHERE user_id = %s", (user_id,))
+        notify_trip_event(cur, 'trips_cleared', user_id)
         conn.commit()
+        response_cache.invalidate(user_id)
     except Exception as e:
         if conn:
             conn.rollback()
@@ -275,16 +1216,659 @@ def clear_data():
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_db_connection(conn)
+
+# Load the newest emission factor version for new trips
+def load_active_emission_factors():
+    conn = None
+    cur = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT version, factors FROM emission_factor_versions ORDER BY version DESC LIMIT 1")
+        result = cur.fetchone()
+        if result:
+            # Factors before version: a trip stamped with the new version
+            # never carries the old factors, and the reverse is recomputed
+            active_emission_factors['factors'] = result['factors']
+            active_emission_factors['version'] = result['version']
+        return dict(active_emission_factors)
+    except Exception as e:
+        print(f"Error loading emission factors: {e}")
+        raise
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
+
+# Create a new emission factor version and a job recomputing existing trips
+def create_emission_factor_version(factors: Dict[str, float]):
+    conn = None
+    cur = None
+    try:
+        factors = {mode.lower(): float(value) for mode, value in factors.items()}
+        if any(value < 0 for value in factors.values()):
+            raise ValueError("Emission factors must not be negative")
+        if factors.get(REFERENCE_MODE, 0) <= 0:
+            raise ValueError(f"A positive '{REFERENCE_MODE}' factor is required as the eco-score reference")
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO emission_factor_versions (factors) VALUES (%s) RETURNING version",
+            (Json(factors),)
+        )
+        version = cur.fetchone()['version']
+        cur.execute("INSERT INTO recompute_jobs (factor_version) VALUES (%s) RETURNING *", (version,))
+        job = dict(cur.fetchone())
+        conn.commit()
+
+        active_emission_factors['factors'] = factors
+        active_emission_factors['version'] = version
+        return {"version": version, "factors": factors, "job": job}
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"Error creating emission factor version: {e}")
+        raise
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
+
+# Recompute the next chunk of trips stamped with an older factor version,
+# and their rollup contributions. Trips saved by workers that have not yet
+# picked up the new version get ids past the checkpoint, so the job keeps
+# looking until every worker has refreshed. Returns False once the job has
+# no more work.
+def run_recompute_chunk(job_id):
+    conn = None
+    cur = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        # The job row lock serializes chunks across workers
+        cur.execute("""
+            SELECT j.last_id, j.factor_version, v.factors,
+                   v.created_at < NOW() - %s * INTERVAL '1 second' as settled
+            FROM recompute_jobs j
+            JOIN emission_factor_versions v ON v.version = j.factor_version
+            WHERE j.id = %s AND j.status = 'running'
+            FOR UPDATE OF j
+        """, (FACTORS_REFRESH_INTERVAL, job_id))
+        job = cur.fetchone()
+        if not job:
+            conn.rollback()
+            return False
+
+        cur.execute("""
+            SELECT id FROM trips
+            WHERE id > %s AND (factor_version IS NULL OR factor_version < %s)
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE
+        """, (job['last_id'], job['factor_version'], RECOMPUTE_CHUNK_SIZE))
+        ids = [row['id'] for row in cur.fetchall()]
+        if not ids:
+            done = job['settled']
+            if done:
+                cur.execute("""
+                    UPDATE recompute_jobs
+                    SET status = 'completed', updated_at = NOW(), finished_at = NOW()
+                    WHERE id = %s
+                """, (job_id,))
+                notify_trip_event(cur, 'trips_recomputed', job_id=job_id, done=True)
+            conn.commit()
+            return not done
+
+        cur.execute("""
+            WITH factors AS (
+                SELECT key AS mode, value::float AS per_km
+                FROM jsonb_each_text(%(factors)s::jsonb)
+            ), old AS (
+                SELECT t.id, t.actual_emissions, t.saved_emissions, t.ecoscore, f.per_km
+                FROM trips t
+                JOIN factors f ON f.mode = lower(t.transportMode)
+                WHERE t.id = ANY(%(ids)s) AND t.distance > 0
+            ), changed AS (
+                UPDATE trips t SET
+                    actual_emissions = o.per_km * t.distance,
+                    saved_emissions = GREATEST(0, (%(threshold)s - o.per_km) * t.distance),
+                    ecoscore = LEAST(100, GREATEST(0, 100 - o.per_km / %(reference)s * 100))
+                FROM old o
+                WHERE t.id = o.id
+                RETURNING
+                    t.user_id,
+                    t.transportMode,
+                    t.visitdate,
+                    t.actual_emissions - COALESCE(o.actual_emissions, 0) as d_actual,
+                    t.saved_emissions - COALESCE(o.saved_emissions, 0) as d_saved,
+                    t.ecoscore - COALESCE(o.ecoscore, 0) as d_ecoscore,
+                    CASE WHEN o.ecoscore IS NULL THEN 1 ELSE 0 END as d_ecoscore_count
+            ), by_mode AS (
+                UPDATE trip_mode_rollup r SET
+                    actual_emissions = r.actual_emissions + d.d_actual,
+                    saved_emissions = r.saved_emissions + d.d_saved,
+                    ecoscore_sum = r.ecoscore_sum + d.d_ecoscore,
+                    ecoscore_count = r.ecoscore_count + d.d_ecoscore_count
+                FROM (
+                    SELECT user_id, transportMode, SUM(d_actual) as d_actual, SUM(d_saved) as d_saved,
+                           SUM(d_ecoscore) as d_ecoscore, SUM(d_ecoscore_count) as d_ecoscore_count
+                    FROM changed GROUP BY user_id, transportMode
+                ) d
+                WHERE r.user_id = d.user_id AND r.transportMode = d.transportMode
+            )
+            UPDATE trip_visitdate_rollup r SET
+                actual_emissions = r.actual_emissions + d.d_actual,
+                saved_emissions = r.saved_emissions + d.d_saved,
+                ecoscore_sum = r.ecoscore_sum + d.d_ecoscore,
+                ecoscore_count = r.ecoscore_count + d.d_ecoscore_count
+            FROM (
+                SELECT user_id, visitdate, SUM(d_actual) as d_actual, SUM(d_saved) as d_saved,
+                       SUM(d_ecoscore) as d_ecoscore, SUM(d_ecoscore_count) as d_ecoscore_count
+                FROM changed GROUP BY user_id, visitdate
+            ) d
+            WHERE r.user_id = d.user_id AND r.visitdate = d.visitdate
+        """, {
+            'factors': Json(job['factors']),
+            'ids': ids,
+            'threshold': THRESHOLD_EMISSIONS,
+            'reference': job['factors'][REFERENCE_MODE]
+        })
+        # Trips without a distance or with an unknown mode keep their
+        # emissions but are still brought up to this version
+        cur.execute("""
+            UPDATE trips SET factor_version = %s
+            WHERE id = ANY(%s) AND (factor_version IS NULL OR factor_version < %s)
+        """, (job['factor_version'], ids, job['factor_version']))
+
+        cur.execute("""
+            UPDATE recompute_jobs
+            SET last_id = %s, updated_at = NOW(), last_error = NULL
+            WHERE id = %s
+        """, (ids[-1], job_id))
+        # Progress is on the job row; only completion is broadcast, since
+        # every event makes each open dashboard refetch its summary
+        conn.commit()
+        response_cache.invalidate()
+        return True
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"Error recomputing trips for job {job_id}: {e}")
+        raise
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
+
+def recompute_delay():
+    start_hour, end_hour = RECOMPUTE_BUSINESS_HOURS
+    if start_hour <= datetime.now().hour < end_hour:
+        return RECOMPUTE_BUSINESS_DELAY
+    return RECOMPUTE_DELAY
+
+# Note a failed chunk on the job row so stalled jobs are visible
+def record_recompute_failure(job_id, error):
+    conn = None
+    cur = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE recompute_jobs
+            SET failures = failures + 1, last_error = %s, updated_at = NOW()
+            WHERE id = %s
+        """, (str(error), job_id))
+        conn.commit()
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"Error recording failure of recompute job {job_id}: {e}")
+        raise
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
+
+# Work through a recompute job chunk by chunk until done or shut down,
+# retrying failed chunks with backoff
+def run_recompute_job(job_id):
+    retries = 0
+    try:
+        while not recompute_stop.is_set():
+            try:
+                more = run_recompute_chunk(job_id)
+            except Exception as e:
+                try:
+                    record_recompute_failure(job_id, e)
+                except Exception:
+                    pass
+                if retries >= RECOMPUTE_MAX_RETRIES:
+                    # Progress is checkpointed, so the scheduler resumes the job later
+                    print(f"Recompute job {job_id} stopped after {retries} retries: {e}")
+                    break
+                recompute_stop.wait(RECOMPUTE_RETRY_DELAY * 2 ** retries)
+                retries += 1
+                continue
+            retries = 0
+            if not more:
+                print(f'Recompute job {job_id} finished')
+                break
+            recompute_stop.wait(recompute_delay())
+    finally:
+        with recompute_threads_lock:
+            recompute_threads.pop(job_id, None)
+
+def start_recompute_job(job_id):
+    with recompute_threads_lock:
+        if job_id in recompute_threads:
+            return False
+        thread = threading.Thread(target=run_recompute_job, args=(job_id,), daemon=True)
+        recompute_threads[job_id] = thread
+        thread.start()
+        return True
+
+# Start a thread for every running recompute job that has none in this
+# process, whether interrupted by a restart or stopped after failing
+def resume_recompute_jobs():
+    conn = None
+    cur = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM recompute_jobs WHERE status = 'running' ORDER BY id")
+        job_ids = [row['id'] for row in cur.fetchall()]
+    except Exception as e:
+        print(f"Error resuming recompute jobs: {e}")
+        raise
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
+    return [job_id for job_id in job_ids if start_recompute_job(job_id)]
+
+def run_scheduled_task(name):
+    task = scheduled_tasks[name]
+    # Wait for the first delay so startup is not held up by the task
+    while not scheduler_stop.wait(task['next_delay']):
+        started = time.monotonic()
+        task['last_run_started'] = datetime.now()
+        try:
+            task['last_result'] = task['func']()
+            task['last_error'] = None
+        except Exception as e:
+            task['last_error'] = str(e)
+            print(f"Scheduled task {name} failed: {e}")
+        task['last_run_seconds'] = time.monotonic() - started
+        task['runs'] += 1
+        task['next_delay'] = task['interval']
+
+# Run func every interval seconds in a background thread
+def schedule_task(name, func, interval, first_delay=1.0):
+    if name in scheduled_tasks:
+        return
+    scheduled_tasks[name] = {
+        'func': func,
+        'interval': interval,
+        'next_delay': first_delay,
+        'runs': 0,
+        'last_run_started': None,
+        'last_run_seconds': None,
+        'last_result': None,
+        'last_error': None
+    }
+    thread = threading.Thread(target=run_scheduled_task, args=(name,), daemon=True)
+    scheduled_tasks[name]['thread'] = thread
+    thread.start()
+
+def get_scheduler_status():
+    return {
+        name: {key: value for key, value in task.items() if key not in ('func', 'thread', 'next_delay')}
+        for name, task in scheduled_tasks.items()
+    }
+
+# A user's counts and totals sent with every trip event, read from the rollups
+def get_live_totals(user_id):
+    conn = None
+    cur = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT
+                COALESCE(SUM(pending_count), 0) as pending,
+                COALESCE(SUM(completed_count), 0) as completed,
+                COALESCE(SUM(saved_emissions), 0) as saved,
+                COALESCE(SUM(saved_emissions), 0) - COALESCE(SUM(actual_emissions), 0) as net,
+                COALESCE(SUM(distance), 0) as total_distance,
+                SUM(ecoscore_sum) / NULLIF(SUM(ecoscore_count), 0) as ecoscore
+            FROM trip_visitdate_rollup
+            WHERE user_id = %s
+        """, (user_id,))
+        row = cur.fetchone()
+        return {
+            "counts": {"pending": int(row['pending']), "completed": int(row['completed'])},
+            "totals": {
+                "saved": float(row['saved']),
+                "net": float(row['net']),
+                "totalDistance": float(row['total_distance']),
+                "ecoscore": float(row['ecoscore']) if row['ecoscore'] is not None else 0
+            }
+        }
+    except Exception as e:
+        print(f"Error getting live totals: {e}")
+        raise
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
+
+# Subscribed users each trip event is for, with the events for each
+def group_trip_events(events, subscribed):
+    grouped = {}
+    for event in events:
+        users = [event['user_id']] if event.get('user_id') is not None else subscribed
+        for user_id in users:
+            if user_id in subscribed:
+                grouped.setdefault(user_id, []).append(event)
+    return grouped
+
+# LISTEN on a dedicated connection and publish each trip event to its
+# user's streams with their current totals; a burst of events shares one
+# totals query per user
+def listen_for_trip_events():
+    while not trip_events_stop.is_set():
+        conn = None
+        try:
+            conn = psycopg2.connect(**DB_CONFIG)
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {TRIP_EVENTS_CHANNEL}")
+            while not trip_events_stop.is_set():
+                if not select.select([conn], [], [], 1.0)[0]:
+                    continue
+                conn.poll()
+                events = [json.loads(notify.payload) for notify in conn.notifies]
+                conn.notifies.clear()
+                # The worker that made the change cleared only its own cache
+                for event in events:
+                    response_cache.invalidate(event.get('user_id'))
+                for user_id, user_events in group_trip_events(events, trip_events.topics()).items():
+                    totals = get_live_totals(user_id)
+                    for event in user_events:
+                        trip_events.publish(dict(event, **totals), user_id)
+        except Exception as e:
+            print(f"Trip event listener failed, reconnecting: {e}")
+            trip_events_stop.wait(5)
+        finally:
+            if conn:
+                conn.close()
+
+def start_trip_event_listener():
+    global trip_events_thread
+    if trip_events_thread is None:
+        trip_events_thread = threading.Thread(target=listen_for_trip_events, daemon=True)
+        trip_events_thread.start()
+
+# Reload the POIs and rebuild their spatial index
+def refresh_poi_index():
+    global poi_index
+    try:
+        poi_index = POIIndex(load_pois(POI_SOURCE))
+        # Top places depend on POI ratings as well as trips
+        response_cache.invalidate()
+        return len(poi_index)
+    except Exception as e:
+        print(f"Error loading points of interest from {POI_SOURCE}: {e}")
+        raise
+
+# Nearest POIs per category group, optionally limited to a radius in metres.
+# k=0 returns every POI within the radius instead of the k nearest.
+def get_nearby_places(latitude, longitude, radius, k, groups):
+    index = poi_index
+    results = {}
+    for group in groups:
+        layers = CATEGORY_GROUPS[group]
+        if k:
+            results[group] = index.nearest(latitude, longitude, k, layers, radius)
+        else:
+            results[group] = index.within_radius(latitude, longitude, radius, layers)
+    return results
+
+# Reload the road network; cached routes over the old one are dropped
+def refresh_road_graph():
+    try:
+        graph = load_road_graph(ROAD_GRAPH_SOURCE)
+        route_calculator.set_graph(graph)
+        return len(graph)
+    except Exception as e:
+        print(f"Error loading road graph from {ROAD_GRAPH_SOURCE}: {e}")
+        raise
+
+# Get recompute job
+def get_recompute_job(job_id):
+    conn = None
+    cur = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM recompute_jobs WHERE id = %s", (job_id,))
+        result = cur.fetchone()
+        return dict(result) if result else None
+    except Exception as e:
+        print(f"Error getting recompute job: {e}")
+        raise
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
+
+# Get visit counts per location
+def get_location_visit_counts(user_id, start_date=None, end_date=None):
+    conn = None
+    cur = None
+    try:
+        conditions, params = user_conditions(user_id, start_date, end_date)
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT location, COUNT(*) as visits
+            FROM trips
+            {where_clause(conditions)}
+            GROUP BY location
+            ORDER BY visits DESC
+        """, params)
+        return [dict(row) for row in cur.fetchall()]
+    except Exception as e:
+        print(f"Error getting location visit counts: {e}")
+        raise
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
+
+# Get the top rated visited places, matching trip locations to POIs by name
+def get_top_places(user_id, limit, start_date=None, end_date=None):
+    index = poi_index
+    places = {}
+    for row in get_location_visit_counts(user_id, start_date, end_date):
+        key = normalize_place_name(row['location'])
+        if key in places:
+            places[key]['visits'] += row['visits']
+            continue
+        poi = index.match_name(row['location'])
+        if poi:
+            # Rows arrive most visited first, so this keeps the most common spelling
+            places[key] = {"name": row['location'], "rating": poi['rating'], "visits": row['visits']}
+
+    ranked = sorted(places.values(), key=lambda place: (-place['rating'], -place['visits']))
+    return ranked[:limit]
+
+# Great-circle distance in metres from the point bound to %(lat)s/%(lon)s
+HAVERSINE_SQL = """
+    2 * 6371000 * asin(sqrt(
+        power(sin(radians(latitude - %(lat)s) / 2), 2) +
+        cos(radians(%(lat)s)) * cos(radians(latitude)) *
+        power(sin(radians(longitude - %(lon)s) / 2), 2)
+    ))
+"""
+
+# Get trips within a radius, nearest first, using the geohash index
+def get_trips_within_radius(user_id, latitude, longitude, radius, limit=100, status=None, start_date=None, end_date=None):
+    conn = None
+    cur = None
+    try:
+        prefixes = geohash.covering_prefixes(latitude, longitude, radius)
+        conditions, params = user_conditions(user_id, start_date, end_date)
+        params.update({'lat': latitude, 'lon': longitude, 'radius': radius, 'limit': limit})
+        prefix_conditions = []
+        for i, prefix in enumerate(prefixes):
+            params[f'prefix{i}'] = prefix + '%'
+            prefix_conditions.append(f"geohash LIKE %(prefix{i})s")
+
+        query = f"""
+            SELECT * FROM (
+                SELECT *, {HAVERSINE_SQL} as distance_m
+                FROM trips
+                WHERE ({' OR '.join(prefix_conditions)})
+        """
+        if status:
+            conditions.append("status = %(status)s")
+            params['status'] = status
+        for condition in conditions:
+            query += f" AND {condition}"
+        query += """
+            ) nearby
+            WHERE distance_m <= %(radius)s
+            ORDER BY distance_m
+            LIMIT %(limit)s
+        """
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute(query, params)
+        return [dict(row) for row in cur.fetchall()]
+    except Exception as e:
+        print(f"Error getting trips within radius: {e}")
+        raise
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
+
+# (south, west, north, east) of a web-mercator z/x/y map tile
+def tile_bounds(z, x, y):
+    n = 2 ** z
+    def tile_lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+    return tile_lat(y + 1), x / n * 360 - 180, tile_lat(y), (x + 1) / n * 360 - 180
+
+# Geohash precision giving roughly 16 or more cells across a tile
+def heatmap_precision(z):
+    tile_width = 360 / 2 ** z
+    for precision in range(1, geohash.MAX_PRECISION + 1):
+        if geohash.cell_size(precision)[1] <= tile_width / 16:
+            return precision
+    return geohash.MAX_PRECISION
+
+# Get emissions aggregated over geohash cells inside a map tile
+def get_emissions_heatmap(user_id, z, x, y, precision=None, start_date=None, end_date=None):
+    conn = None
+    cur = None
+    try:
+        south, west, north, east = tile_bounds(z, x, y)
+        precision = precision or heatmap_precision(z)
+        # Corners share a prefix that lets the index skip everything outside
+        corners = [geohash.encode(lat, lon) for lat in (south, north - 1e-9) for lon in (west, east - 1e-9)]
+        prefix = geohash.common_prefix(corners)
+        conditions, params = user_conditions(user_id, start_date, end_date)
+        params.update({
+            'precision': precision, 'prefix': prefix + '%',
+            'south': south, 'north': north, 'west': west, 'east': east
+        })
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT
+                left(geohash, %(precision)s) as cell,
+                COUNT(*) as trips,
+                COALESCE(SUM(actual_emissions), 0) as actual_emissions,
+                COALESCE(SUM(saved_emissions), 0) as saved_emissions
+            FROM trips
+            WHERE geohash LIKE %(prefix)s
+              AND latitude >= %(south)s AND latitude < %(north)s
+              AND longitude >= %(west)s AND longitude < %(east)s
+              {''.join(f" AND {condition}" for condition in conditions)}
+            GROUP BY cell
+        """, params)
+
+        cells = []
+        for row in cur.fetchall():
+            cell_south, cell_west, cell_north, cell_east = geohash.bounds(row['cell'])
+            cells.append(dict(
+                row,
+                latitude=(cell_south + cell_north) / 2,
+                longitude=(cell_west + cell_east) / 2,
+                bounds=[cell_west, cell_south, cell_east, cell_north]
+            ))
+        return {"z": z, "x": x, "y": y, "precision": precision, "cells": cells}
+    except Exception as e:
+        print(f"Error getting emissions heatmap: {e}")
+        raise
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
+
+# Get trip counts by status
+def get_trip_counts(user_id, start_date=None, end_date=None):
+    conn = None
+    cur = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        conditions, params = user_conditions(user_id, start_date, end_date)
+        cur.execute(f"SELECT status, COUNT(*) as count FROM trips{where_clause(conditions)} GROUP BY status", params)
+        counts = {'pending': 0, 'completed': 0}
+        for row in cur.fetchall():
+            counts[row['status']] = row['count']
+        return counts
+    except Exception as e:
+        print(f"Error getting trip counts: {e}")
+        raise
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
 
 # Get total CO2 emissions saved
-def get_total_co2_emissions_saved():
+# Totals over a date range are sums of trip_visitdate_rollup rows
+def get_total_co2_emissions_saved(user_id, start_date=None, end_date=None):
     conn = None
     cur = None
     try:
+        conditions, params = user_conditions(user_id, start_date, end_date)
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute("SELECT COALESCE(SUM(saved_emissions), 0) as total_saved FROM trips")
+        cur.execute(f"""
+            SELECT COALESCE(SUM(saved_emissions), 0) as total_saved
+            FROM trip_visitdate_rollup{where_clause(conditions)}
+        """, params)
         result = cur.fetchone()
         return result['total_saved'] if result else 0
     except Exception as e:
@@ -294,20 +1878,21 @@ def get_total_co2_emissions_saved():
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_db_connection(conn)
 
 # Get net CO2 impact
-def get_net_co2_impact():
+def get_net_co2_impact(user_id, start_date=None, end_date=None):
     conn = None
     cur = None
     try:
+        conditions, params = user_conditions(user_id, start_date, end_date)
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute("""
+        cur.execute(f"""
             SELECT 
                 COALESCE(SUM(saved_emissions), 0) - COALESCE(SUM(actual_emissions), 0) as net_impact 
-            FROM trips
-        """)
+            FROM trip_visitdate_rollup{where_clause(conditions)}
+        """, params)
         result = cur.fetchone()
         return result['net_impact'] if result else 0
     except Exception as e:
@@ -317,16 +1902,20 @@ def get_net_co2_impact():
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_db_connection(conn)
 
 # Get total distance
-def get_total_distance():
+def get_total_distance(user_id, start_date=None, end_date=None):
     conn = None
     cur = None
     try:
+        conditions, params = user_conditions(user_id, start_date, end_date)
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute("SELECT COALESCE(SUM(distance), 0) as total_distance FROM trips")
+        cur.execute(f"""
+            SELECT COALESCE(SUM(distance), 0) as total_distance
+            FROM trip_visitdate_rollup{where_clause(conditions)}
+        """, params)
         result = cur.fetchone()
         return result['total_distance'] if result else 0
     except Exception as e:
@@ -336,16 +1925,20 @@ def get_total_distance():
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_db_connection(conn)
 
 # Get EcoScore
-def get_ecoscore():
+def get_ecoscore(user_id, start_date=None, end_date=None):
     conn = None
     cur = None
     try:
+        conditions, params = user_conditions(user_id, start_date, end_date)
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute("SELECT AVG(ecoscore) as average_ecoscore FROM trips")
+        cur.execute(f"""
+            SELECT SUM(ecoscore_sum) / NULLIF(SUM(ecoscore_count), 0) as average_ecoscore
+            FROM trip_visitdate_rollup{where_clause(conditions)}
+        """, params)
         result = cur.fetchone()
         return result['average_ecoscore'] if result and result['average_ecoscore'] is not None else 0
     except Exception as e:
@@ -355,23 +1948,30 @@ def get_ecoscore():
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_db_connection(conn)
 
 # Get emissions by mode
-def get_emissions_by_mode():
+def get_emissions_by_mode(user_id, start_date=None, end_date=None):
     conn = None
     cur = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute("""
-            SELECT 
-                transportMode, 
-                COALESCE(SUM(actual_emissions), 0) as actual_emissions,
-                COALESCE(SUM(saved_emissions), 0) as saved_emissions
-            FROM trips 
-            GROUP BY transportMode
-        """)
+        conditions, params = user_conditions(user_id, start_date, end_date)
+        if start_date or end_date:
+            # The mode rollup has no dates, so a range reads the user's trips in it
+            cur.execute(f"""
+                SELECT transportMode, SUM(actual_emissions) as actual_emissions,
+                       SUM(saved_emissions) as saved_emissions
+                FROM trips{where_clause(conditions)}
+                GROUP BY transportMode
+            """, params)
+        else:
+            cur.execute("""
+                SELECT transportMode, actual_emissions, saved_emissions
+                FROM trip_mode_rollup
+                WHERE user_id = %(user_id)s AND trip_count > 0
+            """, params)
         results = cur.fetchall()
         return [dict(row) for row in results]
     except Exception as e:
@@ -381,24 +1981,25 @@ def get_emissions_by_mode():
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_db_connection(conn)
 
 # Get visit date and EcoScore
-def get_visit_date_and_ecoscore():
+def get_visit_date_and_ecoscore(user_id, start_date=None, end_date=None):
     conn = None
     cur = None
     try:
+        conditions, params = user_conditions(user_id, start_date, end_date)
+        conditions.append("trip_count > 0")
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute("""
-            SELECT 
-                visitdate, 
-                AVG(ecoscore) as ecoscore
-
-            FROM trips 
-            GROUP BY visitdate 
+        cur.execute(f"""
+            SELECT
+                visitdate,
+                ecoscore_sum / NULLIF(ecoscore_count, 0) as ecoscore
+            FROM trip_visitdate_rollup
+            {where_clause(conditions)}
             ORDER BY visitdate
-        """)
+        """, params)
         results = cur.fetchall()
         return [dict(row) for row in results]
     except Exception as e:
@@ -408,106 +2009,462 @@ def get_visit_date_and_ecoscore():
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_db_connection(conn)
+
+# Get dashboard summary
+def get_dashboard_summary(user_id, start_date=None, end_date=None):
+    conn = None
+    cur = None
+    try:
+        conditions, params = user_conditions(user_id, start_date, end_date)
+        conn = get_db_connection()
+        cur = conn.cursor()
+        # One scan of trips: the () set gives the totals, the other two sets
+        # give the doughnut (per mode) and line chart (per visit date) rows
+        cur.execute(f"""
+            SELECT
+                GROUPING(transportMode) AS mode_grouped,
+                GROUPING(visitdate) AS date_grouped,
+                transportMode,
+                visitdate,
+                COALESCE(SUM(actual_emissions), 0) as actual_emissions,
+                COALESCE(SUM(saved_emissions), 0) as saved_emissions,
+                COALESCE(SUM(distance), 0) as total_distance,
+                AVG(ecoscore) as ecoscore,
+                COUNT(*) FILTER (WHERE status = 'pending') as pending,
+                COUNT(*) FILTER (WHERE status = 'completed') as completed
+            FROM trips{where_clause(conditions)}
+            GROUP BY GROUPING SETS ((), (transportMode), (visitdate))
+        """, params)
+        summary = {
+            "emissions": {"saved": 0, "net": 0},
+            "ecoscore": 0,
+            "totalDistance": 0.0,
+            "counts": {"pending": 0, "completed": 0},
+            "emissionsByMode": [],
+            "lineChartData": []
+        }
+        for row in cur.fetchall():
+            if row['mode_grouped'] and row['date_grouped']:
+                summary['emissions'] = {
+                    "saved": row['saved_emissions'],
+                    "net": row['saved_emissions'] - row['actual_emissions']
+                }
+                summary['ecoscore'] = row['ecoscore'] if row['ecoscore'] is not None else 0
+                summary['totalDistance'] = float(row['total_distance'])
+                summary['counts'] = {"pending": row['pending'], "completed": row['completed']}
+            elif not row['mode_grouped']:
+                summary['emissionsByMode'].append({
+                    "transportmode": row['transportmode'],
+                    "actual_emissions": row['actual_emissions'],
+                    "saved_emissions": row['saved_emissions']
+                })
+            else:
+                summary['lineChartData'].append({
+                    "visitdate": row['visitdate'],
+                    "ecoscore": row['ecoscore']
+                })
+        summary['lineChartData'].sort(key=lambda item: item['visitdate'])
+        return summary
+    except Exception as e:
+        print(f"Error getting dashboard summary: {e}")
+        raise
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
+
+# Check database health
+def check_database_health():
+    conn = None
+    cur = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        return {
+            "status": "ok",
+            "pool": {
+                "min": DB_POOL_MIN_SIZE,
+                "max": DB_POOL_MAX_SIZE,
+                "in_use": len(db_pool._used) if db_pool else 0,
+                "idle": len(db_pool._pool) if db_pool else 0
+            }
+        }
+    except Exception as e:
+        print(f"Database health check failed: {e}")
+        raise
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
+
+# Serve a JSON response from the cache, with an ETag so unchanged
+# dashboards get 304 Not Modified instead of the body. Responses are cached
+# per user so one user's changes only clear their own entries.
+async def cached_json_response(request: Request, key: str, compute, user_id=None):
+    cached = response_cache.get(key, user_id)
+    if cached is None:
+        # Taken before reading so a write committed meanwhile stops the stale body being stored
+        generation = response_cache.generation(user_id)
+        data = await run_in_threadpool(compute)
+        body = json.dumps(jsonable_encoder(data)).encode()
+        cached = (f'"{hashlib.sha1(body).hexdigest()}"', body)
+        response_cache.set(key, cached, user_id, generation)
+
+    etag, body = cached
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def get_emissions(user_id, start_date=None, end_date=None):
+    return {
+        "saved": get_total_co2_emissions_saved(user_id, start_date, end_date),
+        "net": get_net_co2_impact(user_id, start_date, end_date)
+    }
+
+# Optional ?from=YYYY-MM-DD&to=YYYY-MM-DD shared by the trips and stats routes
+def date_range(
+    start_date: Optional[date] = Query(None, alias="from"),
+    end_date: Optional[date] = Query(None, alias="to")
+):
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    return start_date, end_date
+
+def validate_user_id(user_id):
+    if not USER_ID_PATTERN.fullmatch(user_id):
+        raise HTTPException(status_code=400, detail="Invalid user id")
+    return user_id
+
+# The user a request acts for, from the X-User-Id header
+def current_user(header_user: Optional[str] = Header(None, alias="X-User-Id")):
+    return validate_user_id(header_user or DEFAULT_USER_ID)
+
+# The user of /api/stream, which also accepts ?user= because EventSource
+# clients cannot set headers
+def stream_user(
+    header_user: Optional[str] = Header(None, alias="X-User-Id"),
+    query_user: Optional[str] = Query(None, alias="user")
+):
+    return validate_user_id(header_user or query_user or DEFAULT_USER_ID)
 
 # Routes
 @app.get("/api/trips", response_model=List[Dict[str, Any]])
-async def trips(status: Optional[str] = None):
+async def trips(
+    response: Response,
+    status: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: Optional[str] = None,
+    dates: tuple = Depends(date_range),
+    user_id: str = Depends(current_user)
+):
     try:
-        results = get_trips(status)
+        if format not in (None, "json", "ndjson"):
+            raise ValueError(f"Unsupported format: {format}")
+        if format == "ndjson":
+            # Validate before streaming so bad input still gets a 400
+            parse_trip_fields(fields)
+            return StreamingResponse(stream_trips(user_id, status, fields, *dates), media_type="application/x-ndjson")
+
+        if limit or cursor:
+            results, next_cursor = await run_in_threadpool(get_trips, user_id, status, limit or 100, cursor, fields, *dates)
+            if next_cursor:
+                response.headers["X-Next-Cursor"] = next_cursor
+            return results
+
+        results = await run_in_threadpool(get_trips, user_id, status, None, None, fields, *dates)
         return results
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/trips", response_model=Dict[str, Any])
-async def create_trip(trip: TripCreate):
+async def create_trip(trip: TripCreate, user_id: str = Depends(current_user)):
     try:
         # Convert Pydantic model to dictionary, excluding unset values
         trip_dict = trip.dict(exclude_unset=True)
+        trip_dict['user_id'] = user_id
         
-        # Ensure distance is set (default to 0 if not provided)
-        if 'distance' not in trip_dict or trip_dict['distance'] is None:
-            # You might want to calculate distance based on location or set a default
-            trip_dict['distance'] = 10.0  # Default distance
+        # A route search can take a while on a cache miss
+        trip_dict = await run_in_threadpool(resolve_trip_distance, trip_dict)
         
-        result = save_trip(trip_dict)
+        result = await run_in_threadpool(save_trip, trip_dict)
         return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/trips/bulk")
+async def create_trips_bulk(request: Request, user_id: str = Depends(current_user)):
+    try:
+        body = await request.body()
+        rows = parse_bulk_trips(body, request.headers.get('content-type', ''))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not parse trips: {e}")
+    try:
+        valid, errors = await run_in_threadpool(validate_bulk_trips, rows)
+        for trip_dict in valid:
+            trip_dict['user_id'] = user_id
+        ids = await run_in_threadpool(save_trips_bulk, valid) if valid else []
+        return {
+            "inserted": len(ids),
+            "ids": ids,
+            "failed": len(errors),
+            "errors": errors
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/trips")
-async def delete_trips():
+async def delete_trips(user_id: str = Depends(current_user)):
     try:
-        clear_data()
+        await run_in_threadpool(clear_data, user_id)
         return {"message": "All trips deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/emissions")
-async def emissions():
+async def emissions(request: Request, dates: tuple = Depends(date_range), user_id: str = Depends(current_user)):
     try:
-        saved = get_total_co2_emissions_saved()
-        net = get_net_co2_impact()
-        return {
-            "saved": saved,
-            "net": net
-        }
+        return await cached_json_response(request, f"emissions:{dates}", lambda: get_emissions(user_id, *dates), user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/ecoscore")
-async def ecoscore():
+async def ecoscore(request: Request, dates: tuple = Depends(date_range), user_id: str = Depends(current_user)):
     try:
-        score = get_ecoscore()
-        return {"ecoscore": score}
+        return await cached_json_response(request, f"ecoscore:{dates}", lambda: {"ecoscore": get_ecoscore(user_id, *dates)}, user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/trips/total-distance")
-async def total_distance():
+async def total_distance(request: Request, dates: tuple = Depends(date_range), user_id: str = Depends(current_user)):
     try:
-        distance = get_total_distance()
-        return {"totalDistance": float(distance) if distance is not None else 0.0}
+        def compute():
+            distance = get_total_distance(user_id, *dates)
+            return {"totalDistance": float(distance) if distance is not None else 0.0}
+        return await cached_json_response(request, f"total-distance:{dates}", compute, user_id)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/trips/counts")
-async def trip_counts():
+@app.get("/api/trips/nearby")
+async def trips_nearby(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(1000, gt=0, le=100000),
+    limit: int = Query(100, ge=1, le=1000),
+    status: Optional[str] = None,
+    dates: tuple = Depends(date_range),
+    user_id: str = Depends(current_user)
+):
     try:
-        all_trips = get_trips()
-        counts = {'pending': 0, 'completed': 0}
-        for trip in all_trips:
-            if trip['status'] == 'pending':
-                counts['pending'] += 1
+        return await run_in_threadpool(get_trips_within_radius, user_id, lat, lon, radius, limit, status, *dates)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-            elif trip['status'] == 'completed':
-                counts['completed'] += 1
-        return counts
+@app.get("/api/trips/heatmap/{z}/{x}/{y}")
+async def trips_heatmap(
+    request: Request,
+    z: int,
+    x: int,
+    y: int,
+    precision: Optional[int] = Query(None, ge=1, le=geohash.MAX_PRECISION),
+    dates: tuple = Depends(date_range),
+    user_id: str = Depends(current_user)
+):
+    if not 0 <= z <= 22 or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+        raise HTTPException(status_code=400, detail="Invalid tile coordinates")
+    try:
+        key = f"heatmap:{z}:{x}:{y}:{precision}:{dates}"
+        return await cached_json_response(request, key, lambda: get_emissions_heatmap(user_id, z, x, y, precision, *dates), user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/trips/counts")
+async def trip_counts(request: Request, dates: tuple = Depends(date_range), user_id: str = Depends(current_user)):
+    try:
+        return await cached_json_response(request, f"counts:{dates}", lambda: get_trip_counts(user_id, *dates), user_id)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/emissions-by-mode")
-async def emissions_by_mode():
+async def emissions_by_mode(request: Request, dates: tuple = Depends(date_range), user_id: str = Depends(current_user)):
     try:
-        data = get_emissions_by_mode()
-        return data
+        return await cached_json_response(request, f"emissions-by-mode:{dates}", lambda: get_emissions_by_mode(user_id, *dates), user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/line-chart-data")
-async def line_chart_data():
+async def line_chart_data(request: Request, dates: tuple = Depends(date_range), user_id: str = Depends(current_user)):
     try:
-        data = get_visit_date_and_ecoscore()
-        return data
+        return await cached_json_response(request, f"line-chart-data:{dates}", lambda: get_visit_date_and_ecoscore(user_id, *dates), user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/dashboard/summary")
+async def dashboard_summary(request: Request, dates: tuple = Depends(date_range), user_id: str = Depends(current_user)):
+    try:
+        return await cached_json_response(request, f"dashboard-summary:{dates}", lambda: get_dashboard_summary(user_id, *dates), user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Server-Sent Events: a snapshot of the user's counts and totals, then one
+# message per change to their trips so dashboards no longer poll
+@app.get("/api/stream")
+async def stream(user_id: str = Depends(stream_user)):
+    queue = trip_events.subscribe(user_id)
+
+    async def messages():
+        try:
+            yield f"retry: 5000\n\n"
+            yield format_sse(dict(await run_in_threadpool(get_live_totals, user_id), type="snapshot"))
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(message)
+        finally:
+            trip_events.unsubscribe(queue)
+
+    return StreamingResponse(
+        messages(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/cache")
+async def cache_stats():
+    return response_cache.stats()
+
+@app.get("/api/routes/stats")
+async def route_stats():
+    return route_calculator.stats()
+
+@app.get("/api/emission-factors")
+async def emission_factors():
+    return active_emission_factors
+
+@app.post("/api/emission-factors")
+async def update_emission_factors(factors: Dict[str, float]):
+    try:
+        result = await run_in_threadpool(create_emission_factor_version, factors)
+        start_recompute_job(result['job']['id'])
+        return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/emission-factors/jobs/{job_id}")
+async def recompute_job(job_id: int):
+    try:
+        job = await run_in_threadpool(get_recompute_job, job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not job:
+        raise HTTPException(status_code=404, detail="Recompute job not found")
+    return job
+
+@app.get("/api/nearby")
+async def nearby(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(3000, gt=0, le=50000),
+    k: int = Query(2, ge=0, le=100),
+    categories: Optional[str] = None
+):
+    groups = [group.strip() for group in categories.split(',')] if categories else list(CATEGORY_GROUPS)
+    unknown = [group for group in groups if group not in CATEGORY_GROUPS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown categories: {', '.join(unknown)}")
+    return get_nearby_places(lat, lon, radius, k, groups)
+
+@app.get("/api/places/top")
+async def top_places(
+    request: Request,
+    limit: int = Query(5, ge=1, le=100),
+    dates: tuple = Depends(date_range),
+    user_id: str = Depends(current_user)
+):
+    try:
+        key = f"places-top:{limit}:{dates}"
+        return await cached_json_response(request, key, lambda: get_top_places(user_id, limit, *dates), user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/query")
+async def classify_query(q: str = Query(..., min_length=1, max_length=500)):
+    try:
+        return await query_service.classify(q)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/query/stats")
+async def query_stats():
+    return query_service.stats()
+
+@app.get("/api/scheduler")
+async def scheduler_status():
+    return get_scheduler_status()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(content=metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/health")
+async def health():
+    try:
+        return await run_in_threadpool(check_database_health)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
 # Startup event
 @app.on_event("startup")
 def startup_event():
+    init_db_pool()
     initialize_database()
+    load_active_emission_factors()
+    resume_recompute_jobs()
+    start_trip_event_listener()
+    schedule_task('update_trip_statuses', update_trip_statuses, STATUS_UPDATE_INTERVAL)
+    schedule_task('resume_recompute_jobs', resume_recompute_jobs,
+                  RECOMPUTE_RESUME_INTERVAL, RECOMPUTE_RESUME_INTERVAL)
+    schedule_task('refresh_poi_index', refresh_poi_index, POI_REFRESH_INTERVAL, 0)
+    if ROAD_GRAPH_SOURCE:
+        schedule_task('refresh_road_graph', refresh_road_graph, ROAD_GRAPH_REFRESH_INTERVAL, 0)
+    if TRIPS_PARTITIONED:
+        schedule_task('create_trip_partitions', create_upcoming_trip_partitions, TRIPS_PARTITION_INTERVAL)
+    # Picks up factor versions created through other workers
+    schedule_task('refresh_emission_factors', lambda: load_active_emission_factors()['version'],
+                  FACTORS_REFRESH_INTERVAL, FACTORS_REFRESH_INTERVAL)
+
+# Shutdown event
+@app.on_event("shutdown")
+def shutdown_event():
+    scheduler_stop.set()
+    recompute_stop.set()
+    trip_events_stop.set()
+    threads = [task['thread'] for task in scheduled_tasks.values()] + list(recompute_threads.values())
+    if trip_events_thread:
+        threads.append(trip_events_thread)
+    for thread in threads:
+        thread.join(timeout=5)
+    close_db_pool()
 
 # Run the server
 if __name__ == "__main__":
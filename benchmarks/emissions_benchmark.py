@@ -0,0 +1,62 @@
+"""Throughput of the vectorized emissions engine against the per-trip path.
+
+Run from the repository root:
+
+    python benchmarks/emissions_benchmark.py --rows 5000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from emissions import EMISSION_FACTORS, calculate_emissions, calculate_trip_emissions
+
+
+def make_trips(rows, seed):
+    rng = np.random.default_rng(seed)
+    distances = rng.uniform(0.5, 50, rows)
+    modes = rng.choice(list(EMISSION_FACTORS), rows)
+    return distances, modes
+
+
+def best_of(repeats, func):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000, help='trips per vectorized call')
+    parser.add_argument('--scalar-rows', type=int, default=100_000, help='trips for the per-trip baseline')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    distances, modes = make_trips(args.rows, args.seed)
+    vectorized = best_of(args.repeats, lambda: calculate_emissions(distances, modes))
+
+    scalar_distances = distances[:args.scalar_rows].tolist()
+    scalar_modes = modes[:args.scalar_rows].tolist()
+    scalar = best_of(args.repeats, lambda: [
+        calculate_trip_emissions(distance, mode) for distance, mode in zip(scalar_distances, scalar_modes)
+    ])
+
+    # Both paths must agree before their speeds mean anything
+    actual, saved, ecoscore, _ = calculate_emissions(scalar_distances, scalar_modes)
+    expected = np.array([calculate_trip_emissions(d, m) for d, m in zip(scalar_distances[:1000], scalar_modes[:1000])])
+    np.testing.assert_allclose(np.column_stack([actual, saved, ecoscore])[:1000], expected)
+
+    print(f"vectorized: {args.rows:>10,} rows in {vectorized:8.3f}s  {args.rows / vectorized:>14,.0f} rows/s")
+    print(f"per-trip:   {args.scalar_rows:>10,} rows in {scalar:8.3f}s  {args.scalar_rows / scalar:>14,.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
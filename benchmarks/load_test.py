@@ -0,0 +1,264 @@
+"""Load test of the EcoTracker API with the dashboard's request mix.
+
+With --reset, clears every trip in the database from DB_* settings and
+seeds --trips synthetic trips spread over --users users; point DB_NAME at
+a scratch database first. Without it the existing trips are used. Then
+starts the API under uvicorn (or targets --base-url), replays the calls
+the dashboard pages make, each as a random user, at each concurrency
+level and reports p50/p99 latency and throughput per endpoint. Run from
+the repository root:
+
+    DB_NAME=ecotracker_bench python benchmarks/load_test.py --reset --trips 100000 --users 200 --concurrency 1,8,32 --duration 15
+
+Save a run with --json and pass it back with --baseline to fail when an
+endpoint's p99 gets worse than --tolerance allows.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+
+import httpx
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from emissions import EMISSION_FACTORS, calculate_emissions
+
+PLACES = [
+    ("Sabarmati Ashram", 23.0607, 72.5806),
+    ("Kankaria Lake", 22.9986, 72.6011),
+    ("Adalaj Stepwell", 23.1667, 72.5803),
+    ("Dada Hari ni Vav", 23.0375, 72.5998),
+    ("Sidi Saiyyed Mosque", 23.0271, 72.5809),
+    ("Calico Museum of Textiles", 23.0497, 72.5771),
+    ("Amdavad ni Gufa", 23.0388, 72.5513),
+    ("Victoria Garden", 23.0198, 72.5756),
+    ("Sundervan", 23.0236, 72.5351),
+    ("Gujarat Vidhyapeeth", 23.0425, 72.5715),
+    ("Jama Masjid", 23.0234, 72.5874),
+    ("Law Garden", 23.0262, 72.5601),
+]
+MODES = list(EMISSION_FACTORS)
+CATEGORIES = ["Heritage Sites", "Temples and Religious Sites", "Museums", "Parks and Gardens", "Food and Cuisine"]
+
+# (name, method, path, weight) for the calls made when trip_overview.js,
+# travel_insights.js, top_visited_places.js and dashboard.html load. The
+# dashboard's cards and charts come from one summary request, and counts
+# and totals then arrive over one /api/stream connection per page instead
+# of being polled; "stream" times opening it up to the first snapshot.
+REQUEST_MIX = [
+    ("trips", "GET", "/api/trips", 1),
+    ("trips completed", "GET", "/api/trips?status=completed", 2),
+    ("trips counts", "GET", "/api/trips/counts", 1),
+    ("dashboard summary", "GET", "/api/dashboard/summary", 1),
+    ("places top", "GET", "/api/places/top?limit=5", 1),
+    ("stream", "STREAM", "/api/stream", 1),
+    ("save trip", "POST", "/api/trips", 1),
+]
+
+# Calls travel_insights.js makes when the stream delivers a trip event to
+# refresh the charts, made by the saving user after each saved trip
+EVENT_REFETCHES = [
+    ("dashboard summary", "GET", "/api/dashboard/summary"),
+]
+
+
+def user_name(index):
+    return f"user{index}"
+
+
+def synthetic_trip(rng, today):
+    name, latitude, longitude = PLACES[rng.integers(len(PLACES))]
+    visitdate = today + timedelta(days=int(rng.integers(-730, 60)))
+    return {
+        "category": CATEGORIES[rng.integers(len(CATEGORIES))],
+        "location": name,
+        "latitude": latitude + rng.normal(0, 0.002),
+        "longitude": longitude + rng.normal(0, 0.002),
+        "visitdate": visitdate,
+        "transportMode": MODES[rng.integers(len(MODES))],
+        "status": "completed" if visitdate < today else "pending",
+        "distance": round(float(rng.uniform(0.5, 40)), 2),
+    }
+
+
+def seed(trips, users, batch_size, seed_value):
+    import app
+
+    rng = np.random.default_rng(seed_value)
+    today = date.today()
+    app.init_db_pool()
+    app.initialize_database()
+    app.clear_data()
+    start = time.perf_counter()
+    for offset in range(0, trips, batch_size):
+        rows = [synthetic_trip(rng, today) for _ in range(min(batch_size, trips - offset))]
+        actual, saved, ecoscore, _ = calculate_emissions(
+            [row["distance"] for row in rows], [row["transportMode"] for row in rows]
+        )
+        for row, a, s, e in zip(rows, actual, saved, ecoscore):
+            row.update(actual_emissions=float(a), saved_emissions=float(s), ecoscore=float(e))
+            row["user_id"] = user_name(rng.integers(users))
+        app.save_trips_bulk(rows)
+    app.close_db_pool()
+    print(f"seeded {trips:,} trips for {users:,} users in {time.perf_counter() - start:.1f}s")
+
+
+def start_server(port, workers):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/health", timeout=1).status_code == 200:
+                return server, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("API did not become healthy within 60 seconds")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def run_level(base_url, concurrency, duration, users, rng):
+    names = [entry[0] for entry in REQUEST_MIX]
+    weights = [entry[3] for entry in REQUEST_MIX]
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    today = date.today()
+    deadline = time.perf_counter() + duration
+
+    async def request(client, name, method, path, body, headers):
+        start = time.perf_counter()
+        try:
+            if method == "STREAM":
+                async with client.stream("GET", path, headers=headers) as response:
+                    ok = response.status_code < 400
+                    async for line in response.aiter_lines():
+                        if line.startswith("data:"):
+                            break
+            else:
+                response = await client.request(method, path, json=body, headers=headers)
+                ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        latencies[name].append(time.perf_counter() - start)
+        if not ok:
+            errors[name] += 1
+
+    async def worker(client):
+        while time.perf_counter() < deadline:
+            name, method, path, _ = REQUEST_MIX[names.index(random.choices(names, weights)[0])]
+            body = None
+            if method == "POST":
+                body = synthetic_trip(rng, today)
+                body["visitdate"] = body["visitdate"].isoformat()
+            headers = {"X-User-Id": user_name(random.randrange(users))}
+            await request(client, name, method, path, body, headers)
+            if method == "POST":
+                for refetch_name, refetch_method, refetch_path in EVENT_REFETCHES:
+                    await request(client, refetch_name, refetch_method, refetch_path, None, headers)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+
+    results = {}
+    for name in names:
+        values = sorted(latencies[name])
+        results[name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "p50_ms": 1000 * percentile(values, 0.50),
+            "p99_ms": 1000 * percentile(values, 0.99),
+            "rps": len(values) / duration,
+        }
+    return results
+
+
+def print_level(concurrency, results):
+    total = sum(result["rps"] for result in results.values())
+    print(f"\nconcurrency {concurrency}: {total:,.1f} requests/s")
+    print(f"  {'endpoint':<20} {'requests':>9} {'errors':>7} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>8}")
+    for name, result in results.items():
+        print(f"  {name:<20} {result['requests']:>9} {result['errors']:>7} "
+              f"{result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['rps']:>8.1f}")
+
+
+# Endpoints whose p99 grew past the tolerance at any shared concurrency
+def regressions(report, baseline, tolerance):
+    found = []
+    for concurrency, results in report["levels"].items():
+        for name, result in results.items():
+            before = baseline.get("levels", {}).get(concurrency, {}).get(name)
+            if before and before["p99_ms"] > 0 and result["p99_ms"] > before["p99_ms"] * (1 + tolerance):
+                found.append(f"{name} at concurrency {concurrency}: p99 {before['p99_ms']:.2f} -> {result['p99_ms']:.2f} ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reset', action='store_true', help="delete every user's trips and seed synthetic ones")
+    parser.add_argument('--trips', type=int, default=50_000, help='synthetic trips to seed with --reset')
+    parser.add_argument('--users', type=int, default=100, help='users the trips and requests are spread over')
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.add_argument('--concurrency', default='1,8,32', help='comma-separated concurrency levels')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per concurrency level')
+    parser.add_argument('--base-url', help='target a running API instead of starting one')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn workers when starting the API')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative p99 increase')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if args.reset:
+        seed(args.trips, args.users, args.batch_size, args.seed)
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server, base_url = start_server(args.port, args.workers)
+    try:
+        rng = np.random.default_rng(args.seed + 1)
+        report = {"trips": args.trips if args.reset else None, "users": args.users, "duration": args.duration, "levels": {}}
+        for concurrency in [int(level) for level in args.concurrency.split(',')]:
+            results = asyncio.run(run_level(base_url, concurrency, args.duration, args.users, rng))
+            report["levels"][str(concurrency)] = results
+            print_level(concurrency, results)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
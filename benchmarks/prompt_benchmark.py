@@ -0,0 +1,83 @@
+"""Prompt size and modelled LLM latency with all examples against selected ones.
+
+The model is stubbed: its latency is prefill time per prompt token plus a
+fixed decode time, so the numbers show what trimming the prompt saves
+without needing Ollama. Run from the repository root:
+
+    python benchmarks/prompt_benchmark.py --k 8 --prefill-ms 2
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from query_classifier import QueryClassifier, SimilarExampleSelector
+from query_examples import examples, instruction
+
+# Same layout FewShotPromptTemplate produces for python.py's templates
+EXAMPLE_TEMPLATE = "User Query: {query}\nExpected Response: {answer}"
+SUFFIX = "User Query: {input}\nExpected Response:"
+
+QUERIES = [
+    "Show me museums in the old city",
+    "Which temples should I visit?",
+    "Tell me about Sabarmati Ashram",
+    "Show me information about Law Garden",
+    "Where can I eat local food?",
+    "Give me heritage places near the river",
+    "What is there to see at Kankaria?",
+    "Find hotels near the railway station",
+    "Show me gardens for a morning walk",
+    "Tell me about the Calico Museum of Textiles",
+]
+
+
+def render_prompt(selected, query):
+    parts = [instruction] + [EXAMPLE_TEMPLATE.format(**example) for example in selected]
+    parts.append(SUFFIX.format(input=query))
+    return "\n\n".join(parts)
+
+
+# Rough token count: words and punctuation marks
+def count_tokens(text):
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+def measure(name, choose, args):
+    tokens = []
+    select_seconds = []
+    for query in QUERIES:
+        start = time.perf_counter()
+        selected = choose(query)
+        prompt = render_prompt(selected, query)
+        select_seconds.append(time.perf_counter() - start)
+        tokens.append(count_tokens(prompt))
+    prefill = [count * args.prefill_ms for count in tokens]
+    latency = [value + args.decode_ms for value in prefill]
+    print(f"{name:<10} {statistics.mean(tokens):8.0f} tokens  "
+          f"{1000 * statistics.mean(select_seconds):7.3f} ms to build  "
+          f"{statistics.mean(latency):8.1f} ms modelled latency")
+    return statistics.mean(latency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--k', type=int, default=8, help='examples selected per query')
+    parser.add_argument('--prefill-ms', type=float, default=2.0, help='stub prefill time per prompt token')
+    parser.add_argument('--decode-ms', type=float, default=500, help='stub time to generate a short answer')
+    args = parser.parse_args()
+
+    selector = SimilarExampleSelector(QueryClassifier(examples), k=args.k)
+    print(f"{len(examples)} examples, {len(selector.classifier.examples)} after deduplication")
+
+    before = measure('all', lambda query: examples, args)
+    after = measure(f'top-{args.k}', lambda query: selector.select_examples({'input': query}), args)
+    print(f"modelled speedup: {before / after:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Route distance lookups: A* on a cold cache against cached popular routes.
+
+Builds a synthetic street grid over Ahmedabad (or loads --graph, a GeoJSON
+file of road lines), then times distance lookups between random points
+and repeated lookups between the places in the load test. Run from the
+repository root:
+
+    python benchmarks/route_benchmark.py --streets 300 --lookups 200
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_test import PLACES
+from road_graph import RoadGraph, RouteCalculator, load_road_graph
+
+# South-west corner and size in degrees of the synthetic grid
+GRID_ORIGIN = (22.95, 72.50)
+GRID_SPAN = 0.25
+
+
+# streets x streets grid with a few blocks missing so routes detour
+def synthetic_graph(streets, missing, rng):
+    graph = RoadGraph()
+    step = GRID_SPAN / (streets - 1)
+    for i in range(streets):
+        for j in range(streets):
+            latitude = GRID_ORIGIN[0] + i * step
+            longitude = GRID_ORIGIN[1] + j * step
+            if i + 1 < streets and rng.random() >= missing:
+                graph.add_line([[longitude, latitude], [longitude, latitude + step]])
+            if j + 1 < streets and rng.random() >= missing:
+                graph.add_line([[longitude, latitude], [longitude + step, latitude]])
+    return graph
+
+
+def random_point(rng):
+    return GRID_ORIGIN[0] + rng.random() * GRID_SPAN, GRID_ORIGIN[1] + rng.random() * GRID_SPAN
+
+
+def time_lookups(calculator, pairs):
+    timings = []
+    methods = {}
+    for origin, destination in pairs:
+        start = time.perf_counter()
+        _, method = calculator.distance_km(*origin, *destination)
+        timings.append(time.perf_counter() - start)
+        methods[method] = methods.get(method, 0) + 1
+    return timings, methods
+
+
+def report(name, timings, methods):
+    timings = sorted(timings)
+    print(f"{name:<22} {1000 * statistics.mean(timings):9.3f} ms mean  "
+          f"{1000 * timings[int(0.99 * (len(timings) - 1))]:9.3f} ms p99  {methods}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--graph', help='GeoJSON road lines to use instead of the synthetic grid')
+    parser.add_argument('--streets', type=int, default=300, help='streets each way in the synthetic grid')
+    parser.add_argument('--missing', type=float, default=0.1, help='share of synthetic street segments left out')
+    parser.add_argument('--lookups', type=int, default=200)
+    parser.add_argument('--grid', type=float, default=0.001, help='cache grid size in degrees')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    graph = load_road_graph(args.graph) if args.graph else synthetic_graph(args.streets, args.missing, rng)
+    edges = sum(len(edges) for edges in graph.edges)
+    print(f"graph: {len(graph):,} nodes, {edges:,} directed edges, built in {time.perf_counter() - start:.1f}s")
+
+    calculator = RouteCalculator(graph, args.grid, max_entries=10 * args.lookups)
+    random_pairs = [(random_point(rng), random_point(rng)) for _ in range(args.lookups)]
+    report('random, cold cache', *time_lookups(calculator, random_pairs))
+
+    places = [(latitude, longitude) for _, latitude, longitude in PLACES]
+    popular_pairs = [tuple(rng.sample(places, 2)) for _ in range(args.lookups)]
+    report('popular, first pass', *time_lookups(calculator, popular_pairs))
+    report('popular, cached', *time_lookups(calculator, popular_pairs))
+    print(calculator.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+# In-process TTL/LRU cache, private to each worker. Entries are keyed by
+# (scope, key) so one scope can be cleared without touching the others.
+# Clearing also bumps a generation, so a value computed before the clear
+# is not stored after it.
+class MemoryCacheBackend:
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.cleared = 0
+        self.scopes_cleared = {}
+
+    def generation(self, scope=None):
+        with self.lock:
+            return self.cleared, self.scopes_cleared.get(scope, 0)
+
+    def get(self, key, scope=None):
+        with self.lock:
+            entry = self.entries.get((scope, key))
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[(scope, key)]
+                return None
+            self.entries.move_to_end((scope, key))
+            return value
+
+    def set(self, key, value, scope=None, generation=None):
+        with self.lock:
+            if generation is not None and generation != (self.cleared, self.scopes_cleared.get(scope, 0)):
+                return
+            self.entries[(scope, key)] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end((scope, key))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self, scope=None):
+        with self.lock:
+            if scope is None:
+                self.cleared += 1
+                self.entries.clear()
+                return
+            self.scopes_cleared[scope] = self.scopes_cleared.get(scope, 0) + 1
+            for entry_key in [entry_key for entry_key in self.entries if entry_key[0] == scope]:
+                del self.entries[entry_key]
+
+
+# Redis-backed cache shared by every worker; clearing bumps a generation
+# number that is part of every key, so stale entries simply expire. Each
+# scope has its own generation under the global one.
+class RedisCacheBackend:
+    def __init__(self, url, ttl, prefix='ecotracker:cache'):
+        if redis is None:
+            raise RuntimeError("CACHE_REDIS_URL is set but the redis package is not installed")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def generation_key(self, scope=None):
+        if scope is None:
+            return f"{self.prefix}:generation"
+        return f"{self.prefix}:generation:{scope}"
+
+    def generation(self, scope=None):
+        if scope is None:
+            return int(self.client.get(self.generation_key()) or 0), 0
+        generation, scope_generation = self.client.mget(self.generation_key(), self.generation_key(scope))
+        return int(generation or 0), int(scope_generation or 0)
+
+    def full_key(self, key, scope, generation):
+        if scope is None:
+            return f"{self.prefix}:{generation[0]}:{key}"
+        return f"{self.prefix}:{generation[0]}:{scope}:{generation[1]}:{key}"
+
+    def get(self, key, scope=None):
+        value = self.client.get(self.full_key(key, scope, self.generation(scope)))
+        return pickle.loads(value) if value is not None else None
+
+    # A value computed before a clear lands under the old generation,
+    # where nothing reads it
+    def set(self, key, value, scope=None, generation=None):
+        if generation is None:
+            generation = self.generation(scope)
+        self.client.set(self.full_key(key, scope, generation), pickle.dumps(value), ex=max(1, int(self.ttl)))
+
+    def clear(self, scope=None):
+        self.client.incr(self.generation_key(scope))
+
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, scope=None):
+        value = self.backend.get(key, scope)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    # Token to pass to set() for a value about to be computed, so the value
+    # is dropped if the scope is cleared while it is being computed
+    def generation(self, scope=None):
+        return self.backend.generation(scope)
+
+    def set(self, key, value, scope=None, generation=None):
+        self.backend.set(key, value, scope, generation)
+
+    # Clear one scope's entries, or everything when no scope is given
+    def invalidate(self, scope=None):
+        self.backend.clear(scope)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+# Build the cache from CACHE_TTL, CACHE_MAX_ENTRIES and CACHE_REDIS_URL
+def create_response_cache():
+    ttl = float(os.environ.get('CACHE_TTL', '30'))
+    redis_url = os.environ.get('CACHE_REDIS_URL')
+    if redis_url:
+        return ResponseCache(RedisCacheBackend(redis_url, ttl))
+    return ResponseCache(MemoryCacheBackend(ttl, int(os.environ.get('CACHE_MAX_ENTRIES', '256'))))
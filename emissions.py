@@ -0,0 +1,53 @@
+import numpy as np
+
+# Define emission factors
+EMISSION_FACTORS = {
+    'car': 223.6,
+    'bus': 515.2,
+    'ev': 0,
+    'bike': 26.6,
+    'walk': 0
+}
+
+# Emissions per km below this count as saved
+THRESHOLD_EMISSIONS = 113  # kg/km
+# The eco-score is relative to making the same trip by this mode
+REFERENCE_MODE = 'bus'
+
+# Calculate actual/saved emissions and eco-score for arrays of trips.
+# Returns (actual, saved, ecoscore, valid); rows with a non-positive
+# distance or an unknown mode are False in valid and NaN elsewhere.
+def calculate_emissions(distances, modes, factors=None):
+    factors = EMISSION_FACTORS if factors is None else factors
+    distances = np.asarray(distances, dtype=float)
+    modes = np.asarray(modes, dtype=str)
+
+    # Look up each distinct mode once instead of once per trip
+    unique_modes, inverse = np.unique(modes, return_inverse=True)
+    unique_factors = np.array([factors.get(mode.lower(), np.nan) for mode in unique_modes], dtype=float)
+    per_km = unique_factors[inverse.reshape(-1)]
+
+    valid = ~np.isnan(per_km) & (distances > 0)
+    per_km = np.where(valid, per_km, np.nan)
+
+    actual = per_km * distances
+    saved = np.maximum(0, (THRESHOLD_EMISSIONS - per_km) * distances)
+    ecoscore = np.clip(100 - (per_km / factors[REFERENCE_MODE]) * 100, 0, 100)
+    return actual, saved, ecoscore, valid
+
+# Calculate emissions and eco-score for one trip; plain Python because
+# NumPy's per-call overhead outweighs the work for a single row
+def calculate_trip_emissions(distance, transport_mode, factors=None):
+    factors = EMISSION_FACTORS if factors is None else factors
+    distance = float(distance or 0)
+    transport_mode = (transport_mode or '').lower()
+
+    # Prevent division by zero and handle missing mode
+    if distance <= 0 or transport_mode not in factors:
+        raise ValueError(f"Invalid distance or transport mode: {distance}, {transport_mode}")
+
+    per_km = factors[transport_mode]
+    actual_emission = per_km * distance
+    emissions_saved = max(0, (THRESHOLD_EMISSIONS - per_km) * distance)
+    eco_score = max(0, min(100, 100 - (per_km / factors[REFERENCE_MODE]) * 100))
+    return actual_emission, emissions_saved, eco_score
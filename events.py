@@ -0,0 +1,57 @@
+import asyncio
+import json
+import threading
+
+# Messages a slow subscriber may fall behind by before it is told to resync
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+# Fans messages published from any thread out to asyncio subscribers,
+# each reading its own queue on its own event loop. A subscriber only
+# receives messages published to its topic, or to every topic.
+class Broadcaster:
+    def __init__(self, queue_size=SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def topics(self):
+        with self.lock:
+            return {topic for topic, _ in self.subscribers.values()}
+
+    def subscribe(self, topic=None):
+        queue = asyncio.Queue(self.queue_size)
+        with self.lock:
+            self.subscribers[queue] = (topic, asyncio.get_running_loop())
+        return queue
+
+    def unsubscribe(self, queue):
+        with self.lock:
+            self.subscribers.pop(queue, None)
+
+    def publish(self, message, topic=None):
+        with self.lock:
+            subscribers = list(self.subscribers.items())
+        for queue, (queue_topic, loop) in subscribers:
+            if topic is not None and queue_topic != topic:
+                continue
+            try:
+                loop.call_soon_threadsafe(self.deliver, queue, message)
+            except RuntimeError:
+                # The subscriber's loop has closed
+                self.unsubscribe(queue)
+
+    def deliver(self, queue, message):
+        if queue.full():
+            # Dropped deltas cannot be replayed, so ask the client to refetch
+            while not queue.empty():
+                queue.get_nowait()
+            message = {"type": "resync"}
+        queue.put_nowait(message)
+
+
+def format_sse(message):
+    return f"data: {json.dumps(message, default=str)}\n\n"
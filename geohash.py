@@ -0,0 +1,101 @@
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+MAX_PRECISION = 9
+METERS_PER_DEGREE = 111320
+
+
+# Mirrored in SQL by geohash_encode() in app.py; both must agree bit for bit
+def encode(latitude, longitude, precision=MAX_PRECISION):
+    lat_min, lat_max = -90.0, 90.0
+    lon_min, lon_max = -180.0, 180.0
+    chars = []
+    bits = 0
+    char = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_min + lon_max) / 2
+            if longitude >= mid:
+                char = char * 2 + 1
+                lon_min = mid
+            else:
+                char = char * 2
+                lon_max = mid
+        else:
+            mid = (lat_min + lat_max) / 2
+            if latitude >= mid:
+                char = char * 2 + 1
+                lat_min = mid
+            else:
+                char = char * 2
+                lat_max = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[char])
+            bits = 0
+            char = 0
+    return ''.join(chars)
+
+
+# (south, west, north, east) of a geohash cell
+def bounds(geohash):
+    lat_min, lat_max = -90.0, 90.0
+    lon_min, lon_max = -180.0, 180.0
+    even = True
+    for c in geohash:
+        value = BASE32.index(c)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lon_min + lon_max) / 2
+                if bit:
+                    lon_min = mid
+                else:
+                    lon_max = mid
+            else:
+                mid = (lat_min + lat_max) / 2
+                if bit:
+                    lat_min = mid
+                else:
+                    lat_max = mid
+            even = not even
+    return lat_min, lon_min, lat_max, lon_max
+
+
+# Cell height and width in degrees at a precision
+def cell_size(precision):
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+# Prefixes of the cell containing a point and its eight neighbours, at the
+# finest precision whose cells are at least radius_m across. Together they
+# cover every point within radius_m.
+def covering_prefixes(latitude, longitude, radius_m):
+    lat_scale = METERS_PER_DEGREE
+    lon_scale = METERS_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01)
+    precision = 1
+    for candidate in range(MAX_PRECISION, 0, -1):
+        height, width = cell_size(candidate)
+        if height * lat_scale >= radius_m and width * lon_scale >= radius_m:
+            precision = candidate
+            break
+
+    height, width = cell_size(precision)
+    prefixes = set()
+    for d_lat in (-height, 0, height):
+        for d_lon in (-width, 0, width):
+            lat = min(max(latitude + d_lat, -90.0), 90.0 - 1e-9)
+            lon = (longitude + d_lon + 180.0) % 360.0 - 180.0
+            prefixes.add(encode(lat, lon, precision))
+    return sorted(prefixes)
+
+
+def common_prefix(hashes):
+    prefix = hashes[0]
+    for geohash in hashes[1:]:
+        while not geohash.startswith(prefix):
+            prefix = prefix[:-1]
+    return prefix
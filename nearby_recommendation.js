@@ -1,15 +1,7 @@
-// Constants for GeoServer configuration
-const GEOSERVER_URL = "http://localhost:8080/geoserver";
-const SEARCH_RADIUS = 3000; // 2km radius for nearby places
-
-// Tourist place categories from layer attribute
-const TOURIST_CATEGORIES = [
-    'Heritage_Gems',
-    'museum',
-    'Temples and Religious Sites',
-    'Parks',
-    'Public_Structure'
-];
+// Nearby places are answered by the API's in-memory spatial index
+const NEARBY_API_URL = "http://localhost:3000/api/nearby";
+const SEARCH_RADIUS = 3000; // 3km radius for nearby places
+const PLACES_PER_CATEGORY = 2;
 
 // Function to get user's current location
 function getCurrentLocation() {
@@ -27,67 +19,40 @@ function getCurrentLocation() {
     });
 }
 
-// Function to calculate distance for sorting
-function calculateDistance(lat1, lon1, lat2, lon2) {
-    const R = 6371;
-    const dLat = (lat2 - lat1) * Math.PI / 180;
-    const dLon = (lon2 - lon1) * Math.PI / 180;
-    const a = Math.sin(dLat/2) * Math.sin(dLat/2) +
-              Math.cos(lat1 * Math.PI / 180) * Math.cos(lat2 * Math.PI / 180) * 
-              Math.sin(dLon/2) * Math.sin(dLon/2);
-    const c = 2 * Math.atan2(Math.sqrt(a), Math.sqrt(1-a));
-    return R * c;
+// Function to fetch the nearest places for every category in one request
+async function fetchNearbyRecommendations(latitude, longitude, categories = ['hotel', 'food', 'tourist_places']) {
+    const params = new URLSearchParams({
+        lat: latitude,
+        lon: longitude,
+        radius: SEARCH_RADIUS,
+        k: PLACES_PER_CATEGORY,
+        categories: categories.join(',')
+    });
+    const response = await fetch(`${NEARBY_API_URL}?${params}`);
+    if (!response.ok) {
+        throw new Error(`Nearby API error: ${response.status}`);
+    }
+    const data = await response.json();
+
+    // Return only the site names, nearest first
+    const names = {};
+    for (const category of categories) {
+        names[category] = (data[category] || []).map(place => place.name);
+    }
+    return names;
 }
 
-// Function to fetch nearby places from GeoServer based on layer
+// Function to fetch nearby places for a single layer
 async function fetchNearbyPlaces(latitude, longitude, layer) {
-    const bbox = calculateBoundingBox(latitude, longitude, SEARCH_RADIUS);
-    const url = `${GEOSERVER_URL}/wfs?service=WFS&version=1.0.0&request=GetFeature&typeName=routing:ahm_point&outputFormat=application/json&bbox=${bbox.join(',')},EPSG:4326`;
-
     try {
-        const response = await fetch(url);
-        const data = await response.json();
-        
-        // Filter features based on layer type
-        const filteredFeatures = data.features.filter(feature => {
-            if (layer === 'tourist_places') {
-                return TOURIST_CATEGORIES.includes(feature.properties.layer);
-            }
-            return feature.properties.layer === layer;
-        });
-
-        // Sort by distance and return only site names
-        return filteredFeatures
-            .map(feature => ({
-                name: feature.properties.site_name,
-                distance: calculateDistance(
-                    latitude,
-                    longitude,
-                    feature.properties.latitude,
-                    feature.properties.longitude
-                )
-            }))
-            .sort((a, b) => a.distance - b.distance)
-            .slice(0, 2) // Get top 2 nearest places
-            .map(place => place.name); // Return only the names
+        const names = await fetchNearbyRecommendations(latitude, longitude, [layer]);
+        return names[layer];
     } catch (error) {
         console.error(`Error fetching ${layer}:`, error);
         return ['Unable to load places'];
     }
 }
 
-// Function to calculate bounding box for WFS query
-function calculateBoundingBox(latitude, longitude, radius) {
-    const latDegree = radius / 111320;
-    const lonDegree = radius / (111320 * Math.cos(latitude * Math.PI / 180));
-    return [
-        longitude - lonDegree,
-        latitude - latDegree,
-        longitude + lonDegree,
-        latitude + latDegree
-    ];
-}
-
 // Function to update recommendations in the UI with original dashboard styling
 function updateRecommendationsUI(recommendations) {
     // Update Hotels section - keeping original styling
@@ -130,18 +95,14 @@ async function updateRecommendations() {
     try {
         const coords = await getCurrentLocation();
         
-        // Fetch recommendations for each category
-        const [hotels, restaurants, places] = await Promise.all([
-            fetchNearbyPlaces(coords.latitude, coords.longitude, 'hotel'),
-            fetchNearbyPlaces(coords.latitude, coords.longitude, 'food'),
-            fetchNearbyPlaces(coords.latitude, coords.longitude, 'tourist_places')
-        ]);
+        // Fetch recommendations for all categories at once
+        const nearby = await fetchNearbyRecommendations(coords.latitude, coords.longitude);
 
         // Update UI with fetched recommendations
         updateRecommendationsUI({
-            hotels,
-            restaurants,
-            places
+            hotels: nearby.hotel,
+            restaurants: nearby.food,
+            places: nearby.tourist_places
         });
 
     } catch (error) {
@@ -168,5 +129,6 @@ document.addEventListener('DOMContentLoaded', () => {
 export {
     updateRecommendations,
     getCurrentLocation,
-    fetchNearbyPlaces
+    fetchNearbyPlaces,
+    fetchNearbyRecommendations
 };
\ No newline at end of file
@@ -0,0 +1,181 @@
+import heapq
+import json
+import math
+import urllib.request
+
+EARTH_RADIUS_M = 6371000
+
+# Tourist place categories from the ahm_point layer attribute
+TOURIST_CATEGORIES = {
+    'Heritage_Gems',
+    'museum',
+    'Temples and Religious Sites',
+    'Parks',
+    'Public_Structure'
+}
+
+# Groups answered by /api/nearby, mapped to the layer values they include
+CATEGORY_GROUPS = {
+    'hotel': {'hotel'},
+    'food': {'food'},
+    'tourist_places': TOURIST_CATEGORIES
+}
+
+
+# Same normalization as the dashboard: case-insensitive, collapsed whitespace
+def normalize_place_name(name):
+    return ' '.join((name or '').lower().split())
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+# Numeric rating or None, so one malformed value ("N/A", "4.5/5") cannot
+# abort loading the whole layer
+def parse_rating(value):
+    try:
+        rating = float(value)
+    except (TypeError, ValueError):
+        return None
+    return rating if math.isfinite(rating) else None
+
+
+# Turn GeoJSON point features into flat POI dicts, skipping unusable ones
+def pois_from_geojson(data):
+    pois = []
+    for feature in data.get('features', []):
+        properties = feature.get('properties') or {}
+        coordinates = (feature.get('geometry') or {}).get('coordinates') or [None, None]
+        try:
+            latitude = float(properties.get('latitude', coordinates[1]))
+            longitude = float(properties.get('longitude', coordinates[0]))
+        except (IndexError, TypeError, ValueError):
+            continue
+        if not properties.get('site_name'):
+            continue
+        pois.append({
+            'name': properties['site_name'],
+            'layer': properties.get('layer'),
+            'latitude': latitude,
+            'longitude': longitude,
+            'rating': parse_rating(properties.get('rating'))
+        })
+    return pois
+
+
+# Read GeoJSON from a local file or a WFS GetFeature URL
+def load_geojson(source, timeout=30):
+    if source.startswith(('http://', 'https://')):
+        with urllib.request.urlopen(source, timeout=timeout) as response:
+            return json.load(response)
+    with open(source, encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Load POIs from a local GeoJSON file or a WFS GetFeature URL
+def load_pois(source, timeout=30):
+    return pois_from_geojson(load_geojson(source, timeout))
+
+
+# Uniform lat/lon grid over the POIs. Cells are cell_size degrees square,
+# so radius and k-nearest queries only visit cells near the query point.
+class POIIndex:
+    def __init__(self, pois, cell_size=0.01):
+        self.pois = pois
+        self.cell_size = cell_size
+        self.cells = {}
+        # Rated POIs by normalized name, for matching trip locations
+        self.by_name = {}
+        for poi in pois:
+            self.cells.setdefault(self.cell_of(poi['latitude'], poi['longitude']), []).append(poi)
+            if poi['rating'] and poi['rating'] > 0:
+                self.by_name.setdefault(normalize_place_name(poi['name']), poi)
+        # Occupied cell bounds as (min_row, max_row, min_col, max_col)
+        rows = [row for row, _ in self.cells]
+        cols = [col for _, col in self.cells]
+        self.bounds = (min(rows), max(rows), min(cols), max(cols)) if self.cells else None
+
+    def __len__(self):
+        return len(self.pois)
+
+    def match_name(self, name):
+        return self.by_name.get(normalize_place_name(name))
+
+    def cell_of(self, latitude, longitude):
+        return (math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size))
+
+    # Smallest distance in metres covered by rings of cells around a point
+    def ring_reach_m(self, latitude, rings):
+        lat_m = rings * self.cell_size * 111320
+        lon_m = lat_m * max(math.cos(math.radians(latitude)), 0.01)
+        return min(lat_m, lon_m)
+
+    def ring(self, center, radius):
+        row, col = center
+        if radius == 0:
+            yield center
+            return
+        for d in range(-radius, radius + 1):
+            yield (row - radius, col + d)
+            yield (row + radius, col + d)
+        for d in range(-radius + 1, radius):
+            yield (row + d, col - radius)
+            yield (row + d, col + radius)
+
+    def matches(self, poi, layers):
+        return layers is None or poi['layer'] in layers
+
+    def within_radius(self, latitude, longitude, radius_m, layers=None):
+        lat_span = radius_m / 111320
+        lon_span = radius_m / (111320 * max(math.cos(math.radians(latitude)), 0.01))
+        min_row, min_col = self.cell_of(latitude - lat_span, longitude - lon_span)
+        max_row, max_col = self.cell_of(latitude + lat_span, longitude + lon_span)
+
+        results = []
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                for poi in self.cells.get((row, col), ()):
+                    if not self.matches(poi, layers):
+                        continue
+                    distance = haversine_m(latitude, longitude, poi['latitude'], poi['longitude'])
+                    if distance <= radius_m:
+                        results.append(dict(poi, distance=distance))
+        results.sort(key=lambda poi: poi['distance'])
+        return results
+
+    def nearest(self, latitude, longitude, k, layers=None, max_distance_m=None):
+        if k <= 0 or not self.cells:
+            return []
+        center = self.cell_of(latitude, longitude)
+        min_row, max_row, min_col, max_col = self.bounds
+        # Rings needed to reach every occupied cell from the center
+        max_rings = max(abs(center[0] - min_row), abs(center[0] - max_row),
+                        abs(center[1] - min_col), abs(center[1] - max_col))
+
+        best = []  # max-heap of (-distance, tiebreak, poi)
+        for rings in range(max_rings + 1):
+            for cell in self.ring(center, rings):
+                for poi in self.cells.get(cell, ()):
+                    if not self.matches(poi, layers):
+                        continue
+                    distance = haversine_m(latitude, longitude, poi['latitude'], poi['longitude'])
+                    if max_distance_m is not None and distance > max_distance_m:
+                        continue
+                    entry = (-distance, id(poi), poi)
+                    if len(best) < k:
+                        heapq.heappush(best, entry)
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, entry)
+            # Anything in further rings is at least this far away
+            reach = self.ring_reach_m(latitude, rings)
+            if len(best) == k and -best[0][0] <= reach:
+                break
+            if max_distance_m is not None and reach >= max_distance_m:
+                break
+        return [dict(poi, distance=-neg) for neg, _, poi in sorted(best, reverse=True)]
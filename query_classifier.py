@@ -0,0 +1,218 @@
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+try:
+    from langchain_core.example_selectors import BaseExampleSelector
+except ImportError:
+    BaseExampleSelector = object
+
+NGRAM_SIZE = 3
+
+# Similarity the nearest example must reach, and its lead over the nearest
+# example with a different answer, before the LLM is skipped
+DEFAULT_THRESHOLD = 0.75
+DEFAULT_MARGIN = 0.15
+
+
+# Lower-case, drop punctuation and collapse whitespace
+def normalize_query(text):
+    return ' '.join(re.sub(r"[^\w\s]", ' ', (text or '').lower()).split())
+
+
+# Rendered the way example_prompt shows answers to the model
+def render_answer(answer):
+    if isinstance(answer, str):
+        return answer.strip()
+    return str([part.strip() for part in answer])
+
+
+# Examples with surrounding whitespace trimmed from their answers, keeping
+# the first of any that only differ in case or punctuation
+def dedupe_examples(examples):
+    unique = []
+    seen = set()
+    for example in examples:
+        answer = example['answer']
+        answer = answer.strip() if isinstance(answer, str) else [part.strip() for part in answer]
+        key = (normalize_query(example['query']), render_answer(answer))
+        if key not in seen:
+            seen.add(key)
+            unique.append(dict(example, answer=answer))
+    return unique
+
+
+# Whole words plus character n-grams of each word, so plurals and small
+# misspellings still share most of their features
+def query_features(normalized):
+    features = Counter()
+    for word in normalized.split():
+        features['w:' + word] += 1
+        padded = f"^{word}$"
+        for i in range(max(len(padded) - NGRAM_SIZE + 1, 1)):
+            features[padded[i:i + NGRAM_SIZE]] += 1
+    return features
+
+
+# TF-IDF nearest-example classifier over the few-shot examples. Queries
+# close enough to one answer are answered locally; the rest return None.
+class QueryClassifier:
+    def __init__(self, examples, threshold=DEFAULT_THRESHOLD, margin=DEFAULT_MARGIN):
+        self.threshold = threshold
+        self.margin = margin
+
+        # Duplicate examples would only skew document frequencies
+        self.examples = [{
+            'query': example['query'],
+            'normalized': normalize_query(example['query']),
+            'answer': render_answer(example['answer']),
+            'example': example
+        } for example in dedupe_examples(examples)]
+
+        # Exact matches, unless the examples disagree on the answer
+        self.exact = {}
+        for example in self.examples:
+            previous = self.exact.setdefault(example['normalized'], example['answer'])
+            if previous != example['answer']:
+                self.exact[example['normalized']] = None
+
+        features = [query_features(example['normalized']) for example in self.examples]
+        document_frequency = Counter(feature for counts in features for feature in counts)
+        total = len(self.examples)
+        self.columns = {feature: column for column, feature in enumerate(document_frequency)}
+        self.idf = np.array([math.log((1 + total) / (1 + df)) + 1 for df in document_frequency.values()])
+        # Features no example has are as informative as they get
+        self.unseen_idf = math.log(1 + total) + 1
+
+        # One L2-normalized TF-IDF row per example
+        self.matrix = np.zeros((total, len(self.columns)))
+        for row, counts in enumerate(features):
+            for feature, count in counts.items():
+                self.matrix[row, self.columns[feature]] = count
+        self.matrix *= self.idf
+        self.matrix /= np.linalg.norm(self.matrix, axis=1, keepdims=True).clip(min=1e-12)
+        self.answers = [example['answer'] for example in self.examples]
+
+    def vectorize(self, counts):
+        vector = np.zeros(len(self.columns))
+        unseen = 0.0
+        for feature, count in counts.items():
+            column = self.columns.get(feature)
+            if column is None:
+                unseen += (count * self.unseen_idf) ** 2
+            else:
+                vector[column] = count
+        vector *= self.idf
+        norm = math.sqrt(float(vector @ vector) + unseen)
+        return vector / norm if norm else vector
+
+    def similarities(self, query):
+        return self.matrix @ self.vectorize(query_features(normalize_query(query)))
+
+    # The k examples most similar to the query, most similar first, with
+    # at most per_answer of them sharing an answer so near-identical
+    # phrasings do not crowd out the rest
+    def most_similar(self, query, k, per_answer=None):
+        selected = []
+        answer_counts = Counter()
+        for index in np.argsort(-self.similarities(query), kind='stable'):
+            answer = self.examples[index]['answer']
+            if per_answer is not None and answer_counts[answer] >= per_answer:
+                continue
+            answer_counts[answer] += 1
+            selected.append(self.examples[index]['example'])
+            if len(selected) == k:
+                break
+        return selected
+
+    # Cosine similarity of the query to each example, as
+    # (score, answer, example query) for the best example of each answer
+    def rank(self, query):
+        scores = self.similarities(query)
+        ranked = []
+        seen = set()
+        for index in np.argsort(-scores):
+            if scores[index] <= 0:
+                break
+            answer = self.answers[index]
+            if answer not in seen:
+                seen.add(answer)
+                ranked.append((float(scores[index]), answer, self.examples[index]['query']))
+        return ranked
+
+    def classify(self, query):
+        answer = self.exact.get(normalize_query(query))
+        if answer:
+            return {'answer': answer, 'confidence': 1.0, 'example': query}
+
+        ranked = self.rank(query)
+        if not ranked:
+            return None
+        score, answer, example = ranked[0]
+        runner_up = ranked[1][0] if len(ranked) > 1 else 0.0
+        if score < self.threshold or score - runner_up < self.margin:
+            return None
+        return {'answer': answer, 'confidence': score, 'example': example}
+
+
+# Few-shot example selector for FewShotPromptTemplate that includes only
+# the k examples nearest the query instead of the whole list
+class SimilarExampleSelector(BaseExampleSelector):
+    def __init__(self, classifier, k=8, per_answer=2, input_key='input'):
+        self.classifier = classifier
+        self.k = k
+        self.per_answer = per_answer
+        self.input_key = input_key
+
+    def add_example(self, example):
+        sources = [entry['example'] for entry in self.classifier.examples]
+        self.classifier = QueryClassifier(sources + [example], self.classifier.threshold, self.classifier.margin)
+
+    def select_examples(self, input_variables):
+        return self.classifier.most_similar(input_variables[self.input_key], self.k, self.per_answer)
+
+
+# Answers from the classifier when it is confident and from the wrapped
+# chain otherwise, counting how often and how quickly each path answers.
+# parse, when given, turns classifier answers into the chain's output type.
+class FastPathChain:
+    def __init__(self, classifier, chain, parse=None):
+        self.classifier = classifier
+        self.chain = chain
+        self.parse = parse
+        self.fast_hits = 0
+        self.fallbacks = 0
+        self.fast_seconds = 0.0
+        self.fallback_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def invoke(self, inputs):
+        start = time.perf_counter()
+        match = self.classifier.classify(inputs['input'])
+        if match:
+            answer = self.parse(match['answer']) if self.parse else match['answer']
+            with self.lock:
+                self.fast_hits += 1
+                self.fast_seconds += time.perf_counter() - start
+            return answer
+
+        result = self.chain.invoke(inputs)
+        with self.lock:
+            self.fallbacks += 1
+            self.fallback_seconds += time.perf_counter() - start
+        return result
+
+    def stats(self):
+        queries = self.fast_hits + self.fallbacks
+        return {
+            "queries": queries,
+            "fast_hits": self.fast_hits,
+            "fallbacks": self.fallbacks,
+            "hit_rate": self.fast_hits / queries if queries else 0.0,
+            "fast_avg_ms": 1000 * self.fast_seconds / self.fast_hits if self.fast_hits else 0.0,
+            "fallback_avg_ms": 1000 * self.fallback_seconds / self.fallbacks if self.fallbacks else 0.0
+        }
@@ -0,0 +1,85 @@
+import ast
+import difflib
+import re
+from enum import Enum
+from typing import Literal, Union
+
+from pydantic import BaseModel
+
+from query_classifier import normalize_query
+
+# How close a misspelt category or place name must be to be corrected
+FUZZY_CUTOFF = 0.85
+
+
+class Category(str, Enum):
+    HERITAGE_SITES = "Heritage Sites"
+    TEMPLES = "Temples and Religious Sites"
+    MUSEUMS = "Museums"
+    PARKS = "Parks and Gardens"
+    PUBLIC_INFRASTRUCTURE = "Public Infrastructure"
+    FOOD = "Food and Cuisine"
+    HOTEL = "Hotel"
+    CULTURAL_EVENTS = "Cultural Events"
+
+
+class CategoryAnswer(BaseModel):
+    type: Literal["category"] = "category"
+    category: Category
+
+
+class PlaceAnswer(BaseModel):
+    type: Literal["place"] = "place"
+    name: str
+    # False when the name did not match any place in the registry
+    known: bool
+
+
+QueryAnswer = Union[CategoryAnswer, PlaceAnswer]
+
+# ["Name", "Information"] in either quote style, as the examples show it
+PLACE_PATTERN = re.compile(r"\[\s*(['\"]).+?\1\s*,\s*(['\"])Information\2\s*\]", re.IGNORECASE)
+
+
+# Place names that appear as answers in the few-shot examples
+def known_places(examples):
+    return sorted({example['answer'][0].strip() for example in examples if not isinstance(example['answer'], str)})
+
+
+# Strict parser from model text to a QueryAnswer. Only the first line is
+# read, and category and place names are canonicalized against the
+# registry so callers never re-parse or retry on spelling and spacing.
+class AnswerParser:
+    def __init__(self, places=()):
+        self.categories = {normalize_query(category.value): category for category in Category}
+        self.places = {}
+        for name in places:
+            self.places.setdefault(normalize_query(name), name)
+
+    def add_places(self, names):
+        for name in names:
+            self.places.setdefault(normalize_query(name), name)
+
+    def closest(self, registry, text):
+        key = normalize_query(text)
+        if key in registry:
+            return registry[key]
+        matches = difflib.get_close_matches(key, list(registry), n=1, cutoff=FUZZY_CUTOFF)
+        return registry[matches[0]] if matches else None
+
+    def parse(self, text):
+        if isinstance(text, (CategoryAnswer, PlaceAnswer)):
+            return text
+        lines = str(text).strip().splitlines()
+        line = lines[0].strip() if lines else ''
+
+        match = PLACE_PATTERN.search(line)
+        if match:
+            name = str(ast.literal_eval(match.group(0))[0]).strip()
+            canonical = self.closest(self.places, name)
+            return PlaceAnswer(name=canonical or ' '.join(name.split()), known=canonical is not None)
+
+        category = self.closest(self.categories, line.strip('"\'.'))
+        if category:
+            return CategoryAnswer(category=category)
+        raise ValueError(f"Unrecognized answer: {line!r}")
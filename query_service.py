@@ -0,0 +1,166 @@
+import asyncio
+import os
+import threading
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+from cache import MemoryCacheBackend
+from query_classifier import QueryClassifier, normalize_query
+from query_examples import examples
+from query_results import AnswerParser, known_places
+
+QUERY_CACHE_TTL = float(os.environ.get('QUERY_CACHE_TTL', '3600'))
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get('QUERY_CACHE_MAX_ENTRIES', '1024'))
+# LLM queries arriving within QUERY_BATCH_WAIT seconds of each other share
+# one chain.batch call of at most QUERY_BATCH_SIZE inputs
+QUERY_BATCH_SIZE = int(os.environ.get('QUERY_BATCH_SIZE', '8'))
+QUERY_BATCH_WAIT = float(os.environ.get('QUERY_BATCH_WAIT', '0.01'))
+
+
+# Stand-in for prompt | model with a fixed latency per call, so the service
+# can be exercised without Ollama. A batch costs one call, as it roughly
+# does for a model serving requests in parallel.
+class StubLLMChain:
+    def __init__(self, delay=0.2, answer="Heritage Sites"):
+        self.delay = delay
+        self.answer = answer
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def invoke(self, inputs):
+        return self.batch([inputs])[0]
+
+    def batch(self, inputs_list, return_exceptions=False):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return [self.answer for _ in inputs_list]
+
+
+# Classifies queries for concurrent callers: answers are cached by
+# normalized text, identical in-flight queries share one result, and
+# queries the classifier cannot answer are batched into the LLM chain.
+# Every answer is returned as a parsed category or place.
+class QueryService:
+    def __init__(self, classifier, chain, parser, cache, batch_size=QUERY_BATCH_SIZE, batch_wait=QUERY_BATCH_WAIT):
+        self.classifier = classifier
+        self.chain = chain
+        self.parser = parser
+        self.cache = cache
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.pending = []
+        self.in_flight = {}
+        self.flush_handle = None
+        # The event loop only keeps weak references to tasks
+        self.batch_tasks = set()
+        self.requests = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.fast_hits = 0
+        self.llm_queries = 0
+        self.llm_batches = 0
+
+    async def classify(self, query):
+        self.requests += 1
+        key = normalize_query(query)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        match = self.classifier.classify(query)
+        if match:
+            self.fast_hits += 1
+            answer = self.parser.parse(match['answer'])
+            result = dict(answer.dict(), source="classifier", confidence=match['confidence'])
+            self.cache.set(key, result)
+            return result
+
+        if self.chain is None:
+            raise RuntimeError("No LLM is configured for queries the classifier cannot answer")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.in_flight[key] = future
+        self.pending.append((key, query))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.batch_wait, self.flush)
+        # Shielded so one caller giving up does not cancel the others
+        return await asyncio.shield(future)
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.ensure_future(self.run_batch(batch))
+            self.batch_tasks.add(task)
+            task.add_done_callback(self.batch_tasks.discard)
+
+    async def run_batch(self, batch):
+        self.llm_batches += 1
+        self.llm_queries += len(batch)
+        try:
+            # A failed input comes back as its exception instead of failing the batch
+            answers = await run_in_threadpool(
+                self.chain.batch, [{"input": query} for _, query in batch], return_exceptions=True
+            )
+        except Exception as e:
+            print(f"Error classifying queries with the LLM: {e}")
+            for key, _ in batch:
+                future = self.in_flight.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (key, _), answer in zip(batch, answers):
+            future = self.in_flight.pop(key)
+            try:
+                if isinstance(answer, Exception):
+                    raise answer
+                result = dict(self.parser.parse(answer).dict(), source="llm")
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            self.cache.set(key, result)
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "coalesced": self.coalesced,
+            "classifier_hits": self.fast_hits,
+            "llm_queries": self.llm_queries,
+            "llm_batches": self.llm_batches,
+            "avg_batch_size": self.llm_queries / self.llm_batches if self.llm_batches else 0.0
+        }
+
+
+# Build the service from QUERY_LLM: "ollama" (default) uses the chain in
+# python.py, "stub" a StubLLMChain delayed by QUERY_STUB_DELAY seconds
+def create_query_service():
+    llm = os.environ.get('QUERY_LLM', 'ollama')
+    if llm == 'stub':
+        chain = StubLLMChain(delay=float(os.environ.get('QUERY_STUB_DELAY', '0.2')))
+    else:
+        try:
+            from python import llm_chain as chain
+        except ImportError as e:
+            # The classifier still answers what it can without langchain
+            print(f"LLM chain unavailable, serving classifier answers only: {e}")
+            chain = None
+    cache = MemoryCacheBackend(QUERY_CACHE_TTL, QUERY_CACHE_MAX_ENTRIES)
+    return QueryService(QueryClassifier(examples), chain, AnswerParser(known_places(examples)), cache)
@@ -0,0 +1,195 @@
+import heapq
+import math
+import threading
+from collections import OrderedDict
+
+from poi_index import haversine_m, load_geojson
+
+# Coordinates are rounded to this many decimals (about 1 cm) so lines
+# that share an endpoint share a node
+NODE_PRECISION = 7
+
+# oneway property values meaning a line may only be driven in its drawn direction
+ONEWAY_VALUES = {'yes', 'true', '1', 'y'}
+
+
+# Road network as an adjacency list. Each line segment is an edge weighted
+# by its length in metres, and nodes sit in a lat/lon grid of cell_size
+# degrees so points can be snapped to the nearest node.
+class RoadGraph:
+    def __init__(self, cell_size=0.002):
+        self.cell_size = cell_size
+        self.nodes = []
+        self.node_ids = {}
+        # Per node: list of (neighbour, metres)
+        self.edges = []
+        self.cells = {}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def cell_of(self, latitude, longitude):
+        return (math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size))
+
+    def node(self, latitude, longitude):
+        key = (round(latitude, NODE_PRECISION), round(longitude, NODE_PRECISION))
+        node_id = self.node_ids.get(key)
+        if node_id is None:
+            node_id = len(self.nodes)
+            self.node_ids[key] = node_id
+            self.nodes.append(key)
+            self.edges.append([])
+            self.cells.setdefault(self.cell_of(*key), []).append(node_id)
+        return node_id
+
+    # coordinates are GeoJSON [longitude, latitude] pairs
+    def add_line(self, coordinates, oneway=False):
+        previous = None
+        for point in coordinates:
+            current = self.node(point[1], point[0])
+            if previous is not None and current != previous:
+                metres = haversine_m(*self.nodes[previous], *self.nodes[current])
+                self.edges[previous].append((current, metres))
+                if not oneway:
+                    self.edges[current].append((previous, metres))
+            previous = current
+
+    # (node, metres) of the node nearest a point, or None if none is within max_distance_m
+    def nearest_node(self, latitude, longitude, max_distance_m):
+        lat_span = max_distance_m / 111320
+        lon_span = max_distance_m / (111320 * max(math.cos(math.radians(latitude)), 0.01))
+        min_row, min_col = self.cell_of(latitude - lat_span, longitude - lon_span)
+        max_row, max_col = self.cell_of(latitude + lat_span, longitude + lon_span)
+
+        best = None
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                for node in self.cells.get((row, col), ()):
+                    distance = haversine_m(latitude, longitude, *self.nodes[node])
+                    if distance <= max_distance_m and (best is None or distance < best[1]):
+                        best = (node, distance)
+        return best
+
+    # A* search in metres. The straight-line distance to the target never
+    # exceeds the road distance, so the target's first pop is the shortest.
+    def shortest_path_m(self, source, target):
+        target_lat, target_lon = self.nodes[target]
+
+        def estimate(node):
+            return haversine_m(*self.nodes[node], target_lat, target_lon)
+
+        best = {source: 0.0}
+        queue = [(estimate(source), 0.0, source)]
+        while queue:
+            _, distance, node = heapq.heappop(queue)
+            if node == target:
+                return distance
+            if distance > best[node]:
+                continue
+            for neighbour, metres in self.edges[node]:
+                candidate = distance + metres
+                if candidate < best.get(neighbour, math.inf):
+                    best[neighbour] = candidate
+                    heapq.heappush(queue, (candidate + estimate(neighbour), candidate, neighbour))
+        return None
+
+    # Metres from a point to another along the roads, including the walk to
+    # and from the nearest nodes; None if either point is off the network
+    # or the roads between them do not connect
+    def route_m(self, origin_lat, origin_lon, dest_lat, dest_lon, max_snap_m):
+        origin = self.nearest_node(origin_lat, origin_lon, max_snap_m)
+        destination = self.nearest_node(dest_lat, dest_lon, max_snap_m)
+        if origin is None or destination is None:
+            return None
+        metres = self.shortest_path_m(origin[0], destination[0])
+        if metres is None:
+            return None
+        return origin[1] + metres + destination[1]
+
+
+# Build a RoadGraph from GeoJSON LineString and MultiLineString features
+def graph_from_geojson(data, cell_size=0.002):
+    graph = RoadGraph(cell_size)
+    for feature in data.get('features', []):
+        geometry = feature.get('geometry') or {}
+        properties = feature.get('properties') or {}
+        oneway = str(properties.get('oneway', '')).lower() in ONEWAY_VALUES
+        if geometry.get('type') == 'LineString':
+            graph.add_line(geometry['coordinates'], oneway)
+        elif geometry.get('type') == 'MultiLineString':
+            for line in geometry['coordinates']:
+                graph.add_line(line, oneway)
+    return graph
+
+
+# Load the road graph from a local GeoJSON file or a WFS GetFeature URL
+def load_road_graph(source, timeout=60):
+    return graph_from_geojson(load_geojson(source, timeout))
+
+
+# Trip distances along the road graph, falling back to the great-circle
+# distance when there is no graph, an endpoint is off the network or the
+# roads do not connect. Endpoints are snapped to a grid of grid_size
+# degrees and results kept in an LRU cache keyed by the snapped pair, so
+# repeated trips between popular places skip the search.
+class RouteCalculator:
+    def __init__(self, graph=None, grid_size=0.001, max_entries=10000, max_snap_m=500):
+        self.graph = graph
+        self.grid_size = grid_size
+        self.max_entries = max_entries
+        self.max_snap_m = max_snap_m
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def set_graph(self, graph):
+        with self.lock:
+            self.graph = graph
+            self.entries.clear()
+
+    def snap(self, latitude, longitude):
+        return (round(latitude / self.grid_size), round(longitude / self.grid_size))
+
+    # (km, 'route' or 'haversine') from the origin to the destination
+    def distance_km(self, origin_lat, origin_lon, dest_lat, dest_lon):
+        key = (self.snap(origin_lat, origin_lon), self.snap(dest_lat, dest_lon))
+        if key[0] == key[1]:
+            # Too close for the grid to tell apart
+            return haversine_m(origin_lat, origin_lon, dest_lat, dest_lon) / 1000, 'haversine'
+
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+            graph = self.graph
+
+        # Measured between the grid points so every pair snapping to this
+        # key gets the same answer
+        points = [index * self.grid_size for point in key for index in point]
+        metres = graph.route_m(*points, self.max_snap_m) if graph else None
+        if metres is None:
+            result = (haversine_m(*points) / 1000, 'haversine')
+        else:
+            result = (metres / 1000, 'route')
+
+        with self.lock:
+            # A graph swapped in during the search has already cleared the cache
+            if graph is self.graph:
+                self.entries[key] = result
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return result
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "graph_nodes": len(self.graph) if self.graph else 0,
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
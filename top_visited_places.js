@@ -1,7 +1,7 @@
 class TopVisitedPlaces {
     constructor() {
-        this.geoserverUrl = 'http://localhost:8080/geoserver/wfs';
-        this.tripsApiUrl = 'http://localhost:3000/api/trips';
+        this.topPlacesApiUrl = 'http://localhost:3000/api/places/top';
+        this.topPlacesLimit = 5;
 
         this.chart = null;
         this.useFallbackData = false; // Set to false to always use real data
@@ -156,21 +156,8 @@ class TopVisitedPlaces {
 
     async updateChartData() {
         try {
-            // Always fetch from both sources
-            const sites = await this.fetchSitesData();
-            const dbLocations = await this.fetchDbLocationsWithVisitCounts();
-            
-            console.log('Fetched sites from geoserver:', sites);
-            console.log('Fetched locations from database:', dbLocations);
-
-            // Match places from database with geoserver sites to get ratings
-            const matchedPlaces = this.matchPlaces(sites, dbLocations);
-            console.log('Matched places with ratings:', matchedPlaces);
-            
-            // Get top 5 places by rating
-            const topPlaces = matchedPlaces
-                .sort((a, b) => b.rating - a.rating)
-                .slice(0, 5);
+            // Visit counting and rating lookup happen on the server
+            const topPlaces = await this.fetchTopPlaces();
             console.log('Top places by rating:', topPlaces);
 
             if (topPlaces.length > 0) {
@@ -185,68 +172,23 @@ class TopVisitedPlaces {
         }
     }
 
-    async fetchSitesData() {
+    async fetchTopPlaces() {
         try {
-            const url = `${this.geoserverUrl}?service=WFS&version=1.0.0&request=GetFeature&typeName=ahm_point&outputFormat=application/json`;
-            const response = await fetch(url);
-            
+            const response = await fetch(`${this.topPlacesApiUrl}?limit=${this.topPlacesLimit}`);
+
             if (!response.ok) {
-                throw new Error(`Geoserver error: ${response.status}`);
+                throw new Error(`Top places API error: ${response.status} - ${response.statusText}`);
             }
-            
-            const data = await response.json();
-            const sites = data.features
-                .map(feature => ({
-                    name: feature.properties.site_name,
-                    rating: parseFloat(feature.properties.rating) || 0
-                }))
-                .filter(site => site.rating > 0 && site.name);
-            
-            return sites;
-        } catch (error) {
-            console.error('Error fetching sites from geoserver:', error);
-            throw error;
-        }
-    }
 
-    async fetchDbLocationsWithVisitCounts() {
-        try {
-            console.log(`Fetching trips from API at: ${this.tripsApiUrl}`);
-            const response = await fetch(this.tripsApiUrl);
-            console.log(`Response status: ${response.status}`);
+            const places = await response.json();
 
-            if (!response.ok) {
-                throw new Error(`Trips API error: ${response.status} - ${response.statusText}`);
-            }
-            
-            const trips = await response.json();
-            
-            if (!Array.isArray(trips)) {
-                throw new Error('Expected array of trips');
+            if (!Array.isArray(places)) {
+                throw new Error('Expected array of places');
             }
-            
-            // Count visits for each location
-            const locationCounts = {};
-            trips.forEach(trip => {
-                if (trip && trip.location) {
-                    const normalizedName = this.normalizeLocationName(trip.location);
-                    if (!locationCounts[normalizedName]) {
-                        locationCounts[normalizedName] = {
-                            name: trip.location, // Keep original name for display
-                            count: 0
-                        };
-                    }
-                    locationCounts[normalizedName].count++;
-                }
-            });
-            
-            // Convert to array and sort by visit count (most visited first)
-            const locationsArray = Object.values(locationCounts)
-                .sort((a, b) => b.count - a.count);
-            
-            return locationsArray;
+
+            return places;
         } catch (error) {
-            console.error('Error fetching trips from database:', error);
+            console.error('Error fetching top places:', error);
             throw error;
         }
     }
@@ -259,39 +201,6 @@ class TopVisitedPlaces {
         }
     }
 
-    matchPlaces(sites, dbLocations) {
-        if (!sites.length || !dbLocations.length) {
-            return [];
-        }
-        
-        // Match locations from database with sites from geoserver
-        const matchedPlaces = [];
-        
-        for (const location of dbLocations) {
-            const normalizedLocationName = this.normalizeLocationName(location.name);
-            
-            // Find matching site to get rating
-            const matchingSite = sites.find(site => 
-                this.normalizeLocationName(site.name) === normalizedLocationName
-            );
-            
-            if (matchingSite) {
-                matchedPlaces.push({
-                    name: location.name, // Use original database location name
-                    rating: matchingSite.rating,
-                    visits: location.count
-                });
-            }
-        }
-        
-        return matchedPlaces;
-    }
-
-    normalizeLocationName(name) {
-        if (!name) return '';
-        return name.toLowerCase().trim().replace(/\s+/g, ' ');
-    }
-
     updateChart(places) {
         if (!this.chart) {
             console.error('Chart not initialized');
@@ -329,36 +329,8 @@ function initTravelInsights() {
                 const currentDistance = parseFloat(totalDistanceElement.textContent) || 0;
                 totalDistanceElement.textContent = (currentDistance + trip.distance).toFixed(2);
             }
-            
-            // Update trip counts
-            const plannedVisitsElement = document.querySelector('.planned-visits-count');
-
-            if (plannedVisitsElement && placesVisitedElement) {
-                const response = await fetch('http://localhost:3000/api/trips/counts');
-                if (response.ok) {
-                    const counts = await response.json();
-                    plannedVisitsElement.textContent = counts.pending;
-                    placesVisitedElement.textContent = counts.completed;
-                }
-                if (typeof window.fetchEmissionsData === 'function') {
-                    window.fetchEmissionsData();
-                } else {
-                    // Fallback if fetchEmissionsData isn't available in the global scope
-                    try {
-                        const response = await fetch('http://localhost:3000/api/emissions');
-                        if (response.ok) {
-                            const data = await response.json();
-                            const netCarbonElement = document.getElementById('net');
-                            const emissionsSavedElement = document.getElementById('saved');
-                            
-                        }
-                    } catch (error) {
-                        console.error('Error updating emissions data:', error);
-                    }
-            }
         }
-    }
-});
+    });
 
 
     
@@ -411,13 +383,68 @@ function initTravelInsights() {
         }
     }
 
-    // Update trip counts on load and set interval for periodic updates
-    updateTripCounts();
-    setInterval(updateTripCounts, 10000); // Update every 10 seconds
+    // Apply counts and total distance sent by the server
+    function applyTripTotals(counts, totalDistance) {
+        const plannedVisitsElement = document.querySelector('.planned-visits-count');
+        if (plannedVisitsElement) {
+            plannedVisitsElement.textContent = counts.pending;
+        }
+        const placesVisitedElement = document.querySelector('.places-visited-count');
+        if (placesVisitedElement) {
+            placesVisitedElement.textContent = counts.completed;
+        }
+        const totalDistanceElement = document.getElementById('totalDistance');
+        if (totalDistanceElement) {
+            totalDistanceElement.textContent = `${totalDistance.toFixed(2)} km`;
+        }
+    }
+
+    // Fetch everything the dashboard shows in one request; dashboard.html
+    // draws its cards and charts from the dashboardSummaryLoaded event
+    async function loadDashboardSummary() {
+        try {
+            const response = await fetch('http://localhost:3000/api/dashboard/summary');
+            if (response.ok) {
+                const summary = await response.json();
+                applyTripTotals(summary.counts, summary.totalDistance);
+                document.dispatchEvent(new CustomEvent('dashboardSummaryLoaded', { detail: summary }));
+            }
+        } catch (error) {
+            console.error('Error fetching dashboard summary:', error);
+        }
+    }
 
-    // Update total distance on load and set interval for periodic updates
-    updateTotalDistance();
-    setInterval(updateTotalDistance, 10000); // Update every 10 seconds
+    // Subscribe to trip changes instead of polling; every message carries
+    // the current counts and totals
+    function subscribeToTripEvents() {
+        const events = new EventSource('http://localhost:3000/api/stream');
+        events.onmessage = (message) => {
+            const data = JSON.parse(message.data);
+            if (data.type === 'resync') {
+                // Missed messages, so fetch the current state
+                loadDashboardSummary();
+                return;
+            }
+            applyTripTotals(data.counts, data.totals.totalDistance);
+            document.dispatchEvent(new CustomEvent('tripEventsUpdated', { detail: data }));
+            if (data.type !== 'snapshot') {
+                // The charts are not part of the event, so refetch them
+                loadDashboardSummary();
+            }
+        };
+        events.onerror = (error) => {
+            console.error('Trip event stream error, reconnecting:', error);
+        };
+    }
+
+    loadDashboardSummary();
+    if (window.EventSource) {
+        subscribeToTripEvents();
+    } else {
+        // No Server-Sent Events support, so fall back to polling
+        setInterval(updateTripCounts, 10000); // Update every 10 seconds
+        setInterval(updateTotalDistance, 10000); // Update every 10 seconds
+    }
     
     // Wait for the page to load completely
     window.addEventListener('load', () => {
@@ -442,6 +469,14 @@ function initTravelInsights() {
         enhanceTripDisplayWithDistance();
     });
     
+    // The user's last known position, used as the origin of new trips
+    window.getUserLocation = function() {
+        if (userLatitude === null || userLongitude === null) {
+            return null;
+        }
+        return { latitude: userLatitude, longitude: userLongitude };
+    };
+    
     // Also provide a utility function to manually calculate distance
     window.calculateTripDistance = function(destinationLat, destinationLng) {
         if (userLatitude === null || userLongitude === null) {
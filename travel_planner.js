@@ -117,19 +117,11 @@ async function handleFormSubmit(event) {
 
 
 
-        // Calculate distance if user location is available
-        let distance = null;
-        if (typeof window.calculateTripDistance === 'function' && 
-            locationData && locationData.latitude && locationData.longitude) {
-            distance = window.calculateTripDistance(
-                locationData.latitude, 
-                locationData.longitude
-            );
-
-
-            console.log(`Calculated distance to ${locationData.name}: ${distance} km`);
-        } else {
-            console.warn('Unable to calculate distance: location data or function unavailable');
+        // The server measures the distance along the roads from the user's location
+        const origin = typeof window.getUserLocation === 'function' ? window.getUserLocation() : null;
+        if (!origin) {
+            alert('Allow location access so the trip distance can be calculated');
+            return;
         }
 
 
@@ -142,12 +134,14 @@ async function handleFormSubmit(event) {
         const today = new Date();
         today.setHours(0, 0, 0, 0);
         
-        // Prepare request body with distance if available
+        // Prepare request body
         const requestBody = {
             category,
             location: locationName,
             latitude: latitude,
             longitude: longitude,
+            originLatitude: origin.latitude,
+            originLongitude: origin.longitude,
 
 
 
@@ -157,11 +151,6 @@ async function handleFormSubmit(event) {
 
         };
         
-        // Add distance if calculated
-            if (distance !== null) {
-                requestBody.distance = parseFloat(distance.toFixed(2)); // Round to 2 decimal places
-            }
-            
             // Validate location is a non-empty string
             if (typeof locationName !== 'string' || !locationName.trim()) {
                 throw new Error('Invalid location format');
@@ -178,11 +167,7 @@ async function handleFormSubmit(event) {
 
             if (response.ok) {
                 const tripData = await response.json();
-                let successMessage = 'Trip saved successfully!';
-                if (distance !== null) {
-                    successMessage += ` Distance: ${distance.toFixed(2)} km`;
-                }
-                alert(successMessage);
+                alert(`Trip saved successfully! Distance: ${tripData.distance.toFixed(2)} km`);
                 
                 // Clear form fields
                 document.getElementById('category').value = '';